@@ -1,9 +1,24 @@
+import math
 import numpy as np
 
 from .proposal_inverter import Wallet
+from .rng import rng
 
 
-rng = np.random.default_rng(42)
+def draw_action_randoms(n_wallets: int, n_decisions: int) -> np.ndarray:
+    """Returns uniform random draws for every wallet and decision in one call.
+
+    Each row can be passed as `draws` to an action for the corresponding wallet.
+    """
+    return rng.random(size=(n_wallets, n_decisions))
+
+
+def _uniform(draws: np.ndarray, size: int) -> np.ndarray:
+    """Returns the pre-drawn random numbers, or draws `size` new ones."""
+    if draws is None:
+        return rng.uniform(size=size)
+
+    return draws
 
 
 def a_static_0_percent(wallet: Wallet, wallets: dict, proposals: dict) -> list[bool]:
@@ -11,14 +26,18 @@ def a_static_0_percent(wallet: Wallet, wallets: dict, proposals: dict) -> list[b
     return np.full(shape=len(proposals), fill_value=False)
 
 
-def a_static_1_percent(wallet: Wallet, wallets: dict, proposals: dict) -> list[bool]:
+def a_static_1_percent(
+    wallet: Wallet, wallets: dict, proposals: dict, draws: np.ndarray = None
+) -> list[bool]:
     """Returns `True` with a probability of 1%."""
-    return rng.uniform(size=len(proposals)) < 0.01
+    return _uniform(draws, len(proposals)) < 0.01
 
 
-def a_static_50_percent(wallet: Wallet, wallets: dict, proposals: dict) -> list[bool]:
+def a_static_50_percent(
+    wallet: Wallet, wallets: dict, proposals: dict, draws: np.ndarray = None
+) -> list[bool]:
     """Returns `True` with a probability of 50%."""
-    return rng.uniform(size=len(proposals)) < 0.5
+    return _uniform(draws, len(proposals)) < 0.5
 
 
 def a_static_100_percent(wallet: Wallet, wallets: dict, proposals: dict) -> list[bool]:
@@ -27,68 +46,143 @@ def a_static_100_percent(wallet: Wallet, wallets: dict, proposals: dict) -> list
 
 
 def a_dynamic_joined(
-    wallet: Wallet, wallets: dict, proposals: dict, pr: float
+    wallet: Wallet,
+    wallets: dict,
+    proposals: dict,
+    pr: float,
+    draws: np.ndarray = None,
 ) -> list[bool]:
     """Returns `True` with a specified probability for all proposals this wallet has joined."""
-    return np.array(
-        [
-            rng.random() < pr
-            if wallet.public in proposal.broker_agreements.keys()
-            else False
+    joined = np.fromiter(
+        (
+            wallet.public in proposal.broker_agreements
             for proposal in proposals.values()
-        ]
+        ),
+        dtype=bool,
+        count=len(proposals),
     )
 
+    return joined & (_uniform(draws, joined.size) < pr)
+
 
 def a_dynamic_funded(
-    wallet: Wallet, wallets: dict, proposals: dict, pr: float
+    wallet: Wallet,
+    wallets: dict,
+    proposals: dict,
+    pr: float,
+    draws: np.ndarray = None,
 ) -> list[bool]:
     """Returns `True` with a specified probability for all proposals this wallet has funded."""
-    return np.array(
-        [
-            rng.random() < pr
-            if wallet.public in proposal.payer_agreements.keys()
-            else False
-            for proposal in proposals.values()
-        ]
+    funded = np.fromiter(
+        (wallet.public in proposal.payer_agreements for proposal in proposals.values()),
+        dtype=bool,
+        count=len(proposals),
+    )
+
+    return funded & (_uniform(draws, funded.size) < pr)
+
+
+def wallet_array(wallets: dict) -> np.ndarray:
+    """Returns the wallets as an object array that can be indexed by a mask.
+
+    The rows of a policy's draws and decisions refer to the wallets in the same
+    order.
+    """
+    return np.fromiter(wallets.values(), dtype=object, count=len(wallets))
+
+
+def wallet_index(wallets: dict) -> dict:
+    """Returns the row of each wallet, keyed by its public key."""
+    return {public: i for i, public in enumerate(wallets.keys())}
+
+
+def wallet_funds_array(wallets: dict) -> np.ndarray:
+    """Returns the total funds of every wallet as a single array."""
+    return np.fromiter(
+        (wallet.funds.total_funds() for wallet in wallets.values()),
+        dtype=np.float64,
+        count=len(wallets),
+    )
+
+
+def cancelled_mask(proposals: dict) -> np.ndarray:
+    """Returns whether each proposal has been cancelled."""
+    return np.fromiter(
+        (proposal.cancelled for proposal in proposals.values()),
+        dtype=bool,
+        count=len(proposals),
     )
 
 
+def proposal_feature_matrix(proposals: dict) -> np.ndarray:
+    """Returns the feature vectors of all proposals as the rows of one matrix.
+
+    The rows of cancelled proposals are zeroed, so that any probability derived
+    from them is zero.
+    """
+    if len(proposals) == 0:
+        return np.zeros(shape=(0, 0))
+
+    p_matrix = np.stack([proposal.feature_vector for proposal in proposals.values()])
+    p_matrix[cancelled_mask(proposals)] = 0
+
+    return p_matrix
+
+
+def _normal_pr(wallet_funds: np.ndarray, funds: float, y_scale: float) -> float:
+    """Returns the Gaussian probability with a standard deviation of a third of the maximum funds."""
+    std_dev = wallet_funds.max() / 3
+
+    return y_scale * math.exp(-0.5 * ((funds - wallet_funds.mean()) / std_dev) ** 2)
+
+
 def a_decreasing_linear(
-    wallet: Wallet, wallets: dict, proposals: dict, y_scale: float = 1
+    wallet: Wallet,
+    wallets: dict,
+    proposals: dict,
+    y_scale: float = 1,
+    draws: np.ndarray = None,
 ) -> list[bool]:
     """Based on a linear distribution where lower funds means a higher probability of joining."""
-    max_funds = np.max([w.funds.total_funds() for w in wallets.values()])
-    pr = y_scale * (-wallet.funds.total_funds() / max_funds + 1)
+    wallet_funds = wallet_funds_array(wallets)
+    pr = y_scale * (-wallet.funds.total_funds() / wallet_funds.max() + 1)
 
-    return rng.uniform(size=len(proposals)) < pr
+    return _uniform(draws, len(proposals)) < pr
 
 
 def a_increasing_linear(
-    wallet: Wallet, wallets: dict, proposals: dict, y_scale: float = 1
+    wallet: Wallet,
+    wallets: dict,
+    proposals: dict,
+    y_scale: float = 1,
+    draws: np.ndarray = None,
 ) -> list[bool]:
     """Based on a linear distribution where higher funds means a higher probability of paying."""
-    max_funds = np.max([w.funds.total_funds() for w in wallets.values()])
-    pr = y_scale * (wallet.funds.total_funds() / max_funds)
+    wallet_funds = wallet_funds_array(wallets)
+    pr = y_scale * (wallet.funds.total_funds() / wallet_funds.max())
 
-    return rng.uniform(size=len(proposals)) < pr
+    return _uniform(draws, len(proposals)) < pr
 
 
 def a_normal(
-    wallet: Wallet, wallets: dict, proposals: dict, y_scale: float = 1
+    wallet: Wallet,
+    wallets: dict,
+    proposals: dict,
+    y_scale: float = 1,
+    draws: np.ndarray = None,
 ) -> list[bool]:
     """Based on a normal Gaussian distribution with the mean funds as the centre."""
-    mean_funds = np.mean([w.funds.total_funds() for w in wallets.values()])
-    max_funds = np.max([w.funds.total_funds() for w in wallets.values()])
-    pr = y_scale * np.exp(
-        -0.5 * np.power((wallet.funds.total_funds() - mean_funds) / (max_funds / 3), 2)
-    )
+    pr = _normal_pr(wallet_funds_array(wallets), wallet.funds.total_funds(), y_scale)
 
-    return rng.uniform(size=1) < pr
+    return _uniform(draws, 1) < pr
 
 
 def a_probability(
-    wallet: Wallet, wallets: dict, proposals: dict, y_scale: float = 1
+    wallet: Wallet,
+    wallets: dict,
+    proposals: dict,
+    y_scale: float = 1,
+    draws: np.ndarray = None,
 ) -> list[bool]:
     """Based on the highest probability from the result of matrix factorization."""
     n_proposals = len(proposals)
@@ -96,7 +190,135 @@ def a_probability(
     if n_proposals == 0:
         return list()
 
-    p_matrix = [proposal.feature_vector for proposal in proposals.values()]
-    prs = y_scale * np.matmul(p_matrix, wallet.feature_vector)
+    prs = y_scale * (proposal_feature_matrix(proposals) @ wallet.feature_vector)
+
+    return _uniform(draws, n_proposals) < prs
+
+
+def wallet_feature_matrix(wallets: dict) -> np.ndarray:
+    """Returns the feature vectors of all wallets as the rows of one matrix."""
+    return np.stack([wallet.feature_vector for wallet in wallets.values()])
+
+
+def membership_matrix(index: dict, proposals: dict, agreements: str) -> np.ndarray:
+    """Returns whether each wallet is in the given agreements of each proposal.
+
+    The rows follow `index`, which maps the public key of each wallet to its row.
+    """
+    members = np.zeros(shape=(len(index), len(proposals)), dtype=bool)
+
+    for j, proposal in enumerate(proposals.values()):
+        for public in getattr(proposal, agreements).keys():
+            i = index.get(public)
+
+            if i is not None:
+                members[i, j] = True
+
+    return members
+
+
+def _static_prs(pr: float):
+    def prs(_wallets: dict, _proposals: dict) -> float:
+        return pr
+
+    return prs
+
+
+def _dynamic_joined_prs(wallets: dict, proposals: dict, pr: float) -> np.ndarray:
+    index = wallet_index(wallets)
+
+    return pr * membership_matrix(index, proposals, "broker_agreements")
+
+
+def _dynamic_funded_prs(wallets: dict, proposals: dict, pr: float) -> np.ndarray:
+    index = wallet_index(wallets)
+
+    return pr * membership_matrix(index, proposals, "payer_agreements")
+
+
+def _decreasing_linear_prs(
+    wallets: dict, _proposals: dict, y_scale: float = 1
+) -> np.ndarray:
+    wallet_funds = wallet_funds_array(wallets)
+
+    return y_scale * (-wallet_funds / wallet_funds.max() + 1)[:, np.newaxis]
+
+
+def _increasing_linear_prs(
+    wallets: dict, _proposals: dict, y_scale: float = 1
+) -> np.ndarray:
+    wallet_funds = wallet_funds_array(wallets)
+
+    return y_scale * (wallet_funds / wallet_funds.max())[:, np.newaxis]
+
+
+def _normal_prs(wallets: dict, _proposals: dict, y_scale: float = 1) -> np.ndarray:
+    wallet_funds = wallet_funds_array(wallets)
+    std_dev = wallet_funds.max() / 3
+    prs = np.exp(-0.5 * ((wallet_funds - wallet_funds.mean()) / std_dev) ** 2)
+
+    return y_scale * prs[:, np.newaxis]
+
+
+def _probability_prs(wallets: dict, proposals: dict, y_scale: float = 1) -> np.ndarray:
+    proposal_features = proposal_feature_matrix(proposals)
+
+    return y_scale * (wallet_feature_matrix(wallets) @ proposal_features.T)
+
+
+# The actions whose probabilities can be computed for all wallets at once,
+# mapped to functions taking the same arguments as the action, except for the
+# wallet and the draws, and returning a probability for every wallet and proposal
+_action_prs = {
+    a_static_0_percent: _static_prs(0),
+    a_static_1_percent: _static_prs(0.01),
+    a_static_50_percent: _static_prs(0.5),
+    a_static_100_percent: _static_prs(1),
+    a_dynamic_joined: _dynamic_joined_prs,
+    a_dynamic_funded: _dynamic_funded_prs,
+    a_decreasing_linear: _decreasing_linear_prs,
+    a_increasing_linear: _increasing_linear_prs,
+    a_normal: _normal_prs,
+    a_probability: _probability_prs,
+}
+
+
+# The actions that make a single decision for each wallet, rather than one for
+# each proposal
+_per_wallet_actions = {a_normal}
+
+
+def action_width(action, n_proposals: int) -> int:
+    """Returns the number of decisions an action makes for each wallet."""
+    return 1 if action in _per_wallet_actions else n_proposals
+
+
+def action_matrix(
+    action, wallets: dict, proposals: dict, draws: np.ndarray, *args, **kwargs
+) -> np.ndarray:
+    """Returns the result of an action for every wallet as the rows of one matrix.
+
+    The draws must have a row for each wallet and a column for each decision,
+    as given by `action_width`, and the result has the same shape. The actions
+    in `_action_prs` are evaluated for all wallets at once by comparing the
+    draws against their probabilities. Any other action is called once per
+    wallet, with its row of the draws and the remaining arguments.
+    """
+    if draws.shape != (len(wallets), action_width(action, len(proposals))):
+        raise ValueError("Failed to act, expected one draw for each decision")
+
+    prs = _action_prs.get(action)
+
+    if prs is None:
+        return np.array(
+            [
+                action(wallet, wallets, proposals, *args, draws=wallet_draws, **kwargs)
+                for wallet, wallet_draws in zip(wallets.values(), draws)
+            ],
+            dtype=bool,
+        ).reshape(draws.shape)
+
+    if draws.size == 0:
+        return np.zeros(shape=draws.shape, dtype=bool)
 
-    return rng.uniform(size=n_proposals) < prs
+    return draws < prs(wallets, proposals, *args, **kwargs)
@@ -2,7 +2,7 @@ import param as pm
 
 from collections import defaultdict
 
-from .funds import Funds
+from .funds import Funds, FundsMatrix
 
 
 class WalletAgreement(pm.Parameterized):
@@ -12,16 +12,10 @@ class WalletAgreement(pm.Parameterized):
     payers are specified.
     """
 
-    allocated_funds = pm.ClassSelector(
-        Funds, default=Funds(), doc="total funds that a wallet has yet to claim"
-    )
     claimed_funds = pm.ClassSelector(
         Funds, default=Funds(), doc="total funds that a wallet has claimed thus far"
     )
 
-    def total_allocated(self):
-        return self.allocated_funds.total_funds()
-
     def total_claimed(self):
         return self.total_claimed.total_funds()
 
@@ -34,6 +28,26 @@ class BrokerAgreement(WalletAgreement):
     epoch_joined = pm.Number(0, constant=True, doc="epoch at which this broker joined")
     stake = pm.ClassSelector(Funds, default=Funds(), doc="total funds staked")
 
+    def __init__(self, allocations: FundsMatrix = None, **params):
+        super().__init__(**params)
+
+        # The funds allocated to this broker are kept in a row of a matrix that
+        # is shared with the other brokers of the proposal
+        self.allocations = FundsMatrix() if allocations is None else allocations
+        self.row = self.allocations.add()
+
+    @property
+    def allocated_funds(self) -> Funds:
+        """The total funds that this broker has yet to claim."""
+        return self.allocations[self.row]
+
+    @allocated_funds.setter
+    def allocated_funds(self, funds: dict | Funds):
+        self.allocations[self.row] = funds
+
+    def total_allocated(self):
+        return self.allocated_funds.total_funds()
+
     def total_staked(self):
         return self.stake.total_funds()
 
@@ -43,12 +57,25 @@ class PayerAgreement(WalletAgreement):
     Stores data about a payer in the proposal inverter.
     """
 
+    allocated_funds = pm.ClassSelector(
+        Funds, default=Funds(), doc="total funds that a wallet has yet to claim"
+    )
     contributions = pm.Dict(
         defaultdict(Funds),
         doc="maps the epoch number to the amount of funds a payer contributed during that epoch",
     )
 
+    def contribute(self, epoch: int, funds: Funds):
+        """
+        Records funds contributed during an epoch. Several contributions in the
+        same epoch, such as the stakes of brokers that leave early, are added
+        together.
+        """
+        self.contributions[epoch] += funds
+
+    def total_allocated(self):
+        return self.allocated_funds.total_funds()
+
     def total_contributions(self):
-        return sum(
-            [contribution.total_funds() for contribution in self.contributions.values()]
-        )
+        # The contributions are valued at the current prices
+        return Funds.sum(self.contributions.values()).total_funds()
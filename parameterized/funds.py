@@ -1,82 +1,234 @@
-import param as pm
+import numpy as np
+import operator
 import typing
 
-from collections import defaultdict
-from copy import deepcopy
-
 
 T = typing.TypeVar("T", bound="Funds")
 
 
-class Funds(pm.Parameterized):
-    funds = pm.Dict(defaultdict(float), doc="maps a token to the number of tokens held")
+# Every token is assigned a fixed index the first time it is seen, so that the
+# balances of all `Funds` share the same layout and can be combined as arrays
+_TOKEN_IDX: dict[str, int] = {"USD": 0}
+_TOKENS: list[str] = ["USD"]
+_PRICES = np.ones(1)
+_price_version = 0
+
+
+def _token_index(token: str) -> int:
+    """Returns the index of a token, registering it if it is new."""
+    global _PRICES
+
+    index = _TOKEN_IDX.get(token)
+
+    if index is None:
+        index = _TOKEN_IDX[token] = len(_TOKENS)
+        _TOKENS.append(token)
+        _PRICES = np.append(_PRICES, Funds.price.get(token, np.nan))
+
+    return index
+
+
+def _padded(arr: np.ndarray, size: int) -> np.ndarray:
+    """Returns `arr` extended with zeros to the given size."""
+    if arr.size >= size:
+        return arr
+
+    padded = np.zeros(size, dtype=arr.dtype)
+    padded[: arr.size] = arr
+
+    return padded
+
+
+def _negative(arr: np.ndarray, mask: np.ndarray) -> bool:
+    """Returns whether any balance of the tokens in `mask` is negative.
+
+    Only the tokens of the other operand are checked, so that a balance left
+    just below zero by `Funds.withdraw` does not fail unrelated operations.
+    """
+    return bool(np.any(arr < 0, where=mask))
+
+
+def _to_arrays(funds: dict) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the balances and held tokens of a token to amount mapping."""
+    indices = [_token_index(token) for token in funds.keys()]
+
+    arr = np.zeros(len(_TOKENS))
+    mask = np.zeros(len(_TOKENS), dtype=bool)
+    arr[indices] = list(funds.values())
+    mask[indices] = True
+
+    return arr, mask
+
+
+class Funds:
+    """Stores the number of tokens held of each token.
+
+    Balances are kept in an array indexed by the shared token registry, along
+    with a mask of the tokens that have been set. Tokens that have never been
+    set are treated as missing, like the keys of a dictionary.
+    """
+
+    __slots__ = ("_arr", "_mask", "_total")
+
     price = {"USD": 1.0}
 
-    def __init__(self, funds: dict | T = dict(), price: dict = dict()):
-        super().__init__()
+    def __init__(self, funds: dict | T = None, price: dict = None):
+        global _price_version
+
+        if price:
+            for token, value in price.items():
+                index = _token_index(token)
+                self.price[token] = value
+                _PRICES[index] = value
 
-        self.funds.update(funds)
-        self.price.update(price)
+            _price_version += 1
+
+        if isinstance(funds, Funds):
+            self._arr = funds._arr.copy()
+            self._mask = funds._mask.copy()
+        elif funds:
+            self._arr, self._mask = _to_arrays(funds)
+        else:
+            self._arr = np.zeros(len(_TOKENS))
+            self._mask = np.zeros(len(_TOKENS), dtype=bool)
+
+        self._total = None
+
+    @classmethod
+    def _from_array(cls, arr: np.ndarray, mask: np.ndarray) -> T:
+        """Wraps balances that are already laid out by the token registry."""
+        funds = object.__new__(cls)
+        funds._arr = arr
+        funds._mask = mask
+        funds._total = None
+
+        return funds
+
+    @classmethod
+    def sum(cls, funds: typing.Iterable[dict | T]) -> T:
+        """Returns the total of several funds, accumulated in a single array."""
+        total = cls()
+
+        for other in funds:
+            # The total owns its arrays, as well as any padded copies of them,
+            # so they can be accumulated into in place
+            total._arr, total._mask, arr, mask = total._aligned(other)
+            total._arr += arr
+            total._mask |= mask
+
+        return total
+
+    def __copy__(self):
+        return Funds._from_array(self._arr.copy(), self._mask.copy())
+
+    def __deepcopy__(self, memo: dict):
+        # Parameters instantiate their Funds defaults by deep copying them
+        return self.__copy__()
 
     def convert(self, from_token: str, to_token: str = "USD", n: float = 1.0) -> float:
         return n * self.price[from_token] / self.price[to_token]
 
     def items(self):
-        return self.funds.items()
+        return dict(zip(self.keys(), self._arr[self._mask].tolist())).items()
 
     def keys(self):
-        return self.funds.keys()
+        return [_TOKENS[index] for index in np.flatnonzero(self._mask)]
 
     def total_funds(self, to_token: str = "USD"):
-        return sum(
-            [
-                self.convert(from_token, to_token, n_tokens)
-                for from_token, n_tokens in self.funds.items()
-            ]
-        )
+        # The value of the held tokens is cached until the balances or any
+        # price changes
+        if self._total is None or self._total[0] != _price_version:
+            self._total = (_price_version, self.__value())
+
+        return self._total[1] / self.price[to_token]
 
     def update(self, funds: dict | T = dict()):
         for key, value in funds.items():
-            self.funds[key] = value
-
-    def __negative(self, other: dict | T, factor: int = 1) -> bool:
-        return any(
-            [self.funds[token] + factor * other[token] < 0 for token in other.keys()]
+            self[key] = value
+
+    def _grow(self, size: int):
+        """Extends the balances so that they cover `size` tokens."""
+        if self._arr.size < size:
+            self._arr = _padded(self._arr, size)
+            self._mask = _padded(self._mask, size)
+
+    def _aligned(
+        self, other: dict | T
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the balances and held tokens of `self` and of `other`.
+
+        The arrays are padded to the same size without changing either
+        operand, so they may be the operands' own arrays and must not be
+        modified.
+        """
+        if isinstance(other, Funds):
+            arr, mask = other._arr, other._mask
+        else:
+            arr, mask = _to_arrays(other)
+
+        size = max(self._arr.size, arr.size)
+
+        return (
+            _padded(self._arr, size),
+            _padded(self._mask, size),
+            _padded(arr, size),
+            _padded(mask, size),
         )
 
+    def __value(self) -> float:
+        """Returns the value of the held tokens at the current prices."""
+        prices = _PRICES[: self._arr.size]
+        total = self._arr @ prices
+
+        if np.isnan(total):
+            missing = self._mask & np.isnan(prices)
+
+            if missing.any():
+                raise KeyError(_TOKENS[np.flatnonzero(missing)[0]])
+
+            total = self._arr[~np.isnan(prices)] @ prices[~np.isnan(prices)]
+
+        return float(total)
+
     def __add__(self, other: dict | T):
-        funds = deepcopy(self)
+        self_arr, self_mask, arr, mask = self._aligned(other)
+        funds = self_arr + arr
 
-        if self.__negative(other, factor=1):
+        if _negative(funds, mask):
             raise ValueError("Failed to add, funds cannot be negative")
 
-        for token in other.keys():
-            funds[token] = self.funds[token] + other[token]
-
-        return funds
+        return Funds._from_array(funds, self_mask | mask)
 
     def __iadd__(self, other: dict | T):
         return self + other
 
     def __sub__(self, other: dict | T):
-        funds = deepcopy(self)
+        self_arr, self_mask, arr, mask = self._aligned(other)
+        funds = self_arr - arr
 
-        if self.__negative(other, factor=-1):
+        if _negative(funds, mask):
             raise ValueError("Failed to subtract, funds cannot be negative")
 
-        for token in other.keys():
-            funds[token] = self.funds[token] - other[token]
-
-        return funds
+        return Funds._from_array(funds, self_mask | mask)
 
     def __isub__(self, other: dict | T):
         return self - other
 
+    def withdraw(self, other: dict | T) -> T:
+        """Returns the balances minus `other`, like subtracting them.
+
+        The balances are not checked, so that funds that are known to be held
+        can be withdrawn even if rounding errors leave a balance just below zero.
+        """
+        self_arr, self_mask, arr, mask = self._aligned(other)
+
+        return Funds._from_array(self_arr - arr, self_mask | mask)
+
     def __mul__(self, factor: int | float):
         if factor < 0:
             raise ValueError("Failed to multiply, funds cannot be negative")
 
-        return Funds({key: value * factor for key, value in self.funds.items()})
+        return Funds._from_array(self._arr * factor, self._mask.copy())
 
     def __imul__(self, factor: int | float):
         return self * factor
@@ -87,8 +239,10 @@ class Funds(pm.Parameterized):
     def __truediv__(self, factor: int | float):
         if factor < 0:
             raise ValueError("Failed to divide, funds cannot be negative")
+        elif factor == 0:
+            raise ZeroDivisionError("Failed to divide, division by zero")
 
-        return Funds({key: value / factor for key, value in self.funds.items()})
+        return Funds._from_array(self._arr / factor, self._mask.copy())
 
     def __itruediv__(self, factor: int | float):
         return self / factor
@@ -97,28 +251,166 @@ class Funds(pm.Parameterized):
         if factor < 0:
             raise ValueError("Failed to divide, funds cannot be negative")
 
-        return Funds({key: factor / value for key, value in self.funds.items()})
+        elif np.any(self._arr == 0, where=self._mask):
+            raise ZeroDivisionError("Failed to divide, division by zero")
+
+        funds = np.divide(
+            factor, self._arr, out=np.zeros_like(self._arr), where=self._mask
+        )
+
+        return Funds._from_array(funds, self._mask.copy())
+
+    def _compare(self, other: dict | T, op: typing.Callable) -> bool:
+        """Returns whether `op` holds for the balance of every token in `other`."""
+        self_arr, _, arr, mask = self._aligned(other)
+
+        if arr.size == 1:
+            # Only USD has been registered, so the balances can be compared as
+            # floats without the overhead of a masked reduction
+            return not mask[0] or op(self_arr.item(), arr.item())
+
+        return bool(np.all(op(self_arr, arr), where=mask))
 
     def __lt__(self, other: dict | T):
-        return all([self.funds[token] < other[token] for token in other.keys()])
+        return self._compare(other, operator.lt)
 
     def __le__(self, other: dict | T):
-        return all([self.funds[token] <= other[token] for token in other.keys()])
+        return self._compare(other, operator.le)
 
     def __eq__(self, other: dict | T):
-        return all([self.funds[token] == other[token] for token in other.keys()])
+        return self._compare(other, operator.eq)
 
     def __ne__(self, other: dict | T):
-        return all([self.funds[token] != other[token] for token in other.keys()])
+        return self._compare(other, operator.ne)
 
     def __ge__(self, other: dict | T):
-        return all([self.funds[token] >= other[token] for token in other.keys()])
+        return self._compare(other, operator.ge)
 
     def __gt__(self, other: dict | T):
-        return all([self.funds[token] > other[token] for token in other.keys()])
+        return self._compare(other, operator.gt)
 
     def __getitem__(self, key: str):
-        return self.funds[key]
+        index = _TOKEN_IDX.get(key)
+
+        if index is None or index >= self._arr.size:
+            return 0.0
+
+        return float(self._arr[index])
 
     def __setitem__(self, key: str, value: float):
-        self.funds[key] = value
+        index = _token_index(key)
+
+        self._grow(index + 1)
+        self._arr[index] = value
+        self._mask[index] = True
+        self._total = None
+
+
+class FundsMatrix:
+    """Stores the balances of several `Funds` as the rows of one matrix.
+
+    Rows are handed out with `add` and reused once they are removed, so that
+    funds can be added to every row in use with a single array operation.
+    """
+
+    def __init__(self):
+        self._arr = np.zeros(shape=(0, len(_TOKENS)))
+        self._mask = np.zeros(shape=(0, len(_TOKENS)), dtype=bool)
+        self._active = np.zeros(0, dtype=bool)
+
+        # The sum of all rows is cached until a row changes
+        self._total = None
+
+    def _grow(self, n_rows: int, n_tokens: int):
+        """Extends the matrix so that it covers `n_rows` rows and `n_tokens` tokens."""
+        rows, tokens = self._arr.shape
+
+        if rows < n_rows or tokens < n_tokens:
+            shape = (max(rows, n_rows), max(tokens, n_tokens))
+
+            arr = np.zeros(shape=shape)
+            mask = np.zeros(shape=shape, dtype=bool)
+            active = np.zeros(shape[0], dtype=bool)
+            arr[:rows, :tokens] = self._arr
+            mask[:rows, :tokens] = self._mask
+            active[:rows] = self._active
+
+            self._arr, self._mask, self._active = arr, mask, active
+
+    def add(self) -> int:
+        """Returns the index of an empty row, which is in use until it is removed."""
+        free = np.flatnonzero(~self._active)
+
+        if free.size > 0:
+            row = int(free[0])
+        else:
+            row = self._active.size
+            self._grow(max(1, 2 * row), 0)
+
+        self._active[row] = True
+
+        return row
+
+    def remove(self, row: int):
+        """Empties a row and frees it to be reused."""
+        self._arr[row] = 0
+        self._mask[row] = False
+        self._active[row] = False
+        self._total = None
+
+    def __getitem__(self, row: int) -> Funds:
+        return Funds._from_array(self._arr[row].copy(), self._mask[row].copy())
+
+    def __setitem__(self, row: int, funds: dict | Funds):
+        if not isinstance(funds, Funds):
+            funds = Funds(funds)
+
+        self._grow(0, funds._arr.size)
+        self._arr[row] = _padded(funds._arr, self._arr.shape[1])
+        self._mask[row] = _padded(funds._mask, self._arr.shape[1])
+        self._total = None
+
+    def pop(self, row: int) -> Funds:
+        """Returns the funds in a row and empties it, keeping its tokens."""
+        funds = self[row]
+        self._arr[row] = 0
+        self._total = None
+
+        return funds
+
+    def allocate(self, funds: dict | Funds):
+        """Adds the same funds to every row in use."""
+        if not isinstance(funds, Funds):
+            funds = Funds(funds)
+
+        self._grow(0, funds._arr.size)
+        mask = _padded(funds._mask, self._arr.shape[1])
+        allocated = self._arr[self._active] + _padded(funds._arr, mask.size)
+
+        if _negative(allocated, mask):
+            raise ValueError("Failed to add, funds cannot be negative")
+
+        self._arr[self._active] = allocated
+        self._mask[self._active] |= mask
+        self._total = None
+
+    def total(self) -> Funds:
+        """Returns the sum of all rows, as rows that are not in use are empty.
+
+        The sum is shared between calls until a row changes, so it must not be
+        modified.
+        """
+        if self._total is None:
+            self._total = Funds._from_array(
+                self._arr.sum(axis=0), self._mask.any(axis=0)
+            )
+
+        return self._total
+
+
+def as_funds(funds: dict | Funds) -> Funds:
+    """Returns `funds` as `Funds`, without copying it if it already is."""
+    if isinstance(funds, Funds):
+        return funds
+
+    return Funds(funds)
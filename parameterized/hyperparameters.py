@@ -1,86 +1,96 @@
 import numpy as np
 
-from scipy.stats import norm
+from scipy.special import erf
 
+from .actions import wallet_array
 from .funds import Funds
 from .proposal_inverter import Wallet, ProposalInverter
+from .rng import rng
 
 
-rng = np.random.default_rng(42)
+def _normal_cdf(x: np.ndarray) -> np.ndarray:
+    """Fits a normal distribution to each column of `x` and returns the CDF of `x`."""
+    return 0.5 * (1 + erf((x - x.mean(axis=0)) / (x.std(axis=0) * np.sqrt(2))))
 
 
 def h_wallet_feature_0(wallets: dict):
-    mean, std_dev = norm.fit(
-        [wallet.funds.total_funds() for wallet in wallets.values()]
+    return _normal_cdf(
+        np.fromiter(
+            (wallet.funds.total_funds() for wallet in wallets.values()),
+            dtype=np.float64,
+            count=len(wallets),
+        )
     )
 
-    feature = norm.cdf(
-        x=[wallet.funds.total_funds() for wallet in wallets.values()],
-        loc=mean,
-        scale=std_dev,
-    )
-
-    return feature
-
 
 def h_proposal_feature_0(proposals: dict):
     return np.ones(shape=len(proposals))
 
 
 def h_proposal_feature_1(proposals: dict):
-    mean, std_dev = norm.fit(
-        [proposal.funds.total_funds() for proposal in proposals.values()]
+    return _normal_cdf(
+        np.fromiter(
+            (proposal.funds.total_funds() for proposal in proposals.values()),
+            dtype=np.float64,
+            count=len(proposals),
+        )
     )
 
-    feature = norm.cdf(
-        x=[proposal.funds.total_funds() for proposal in proposals.values()],
-        loc=mean,
-        scale=std_dev,
-    )
-
-    return feature
-
 
 def h_proposal_feature_2(proposals: dict):
-    mean, std_dev = norm.fit(
-        [proposal.current_epoch for proposal in proposals.values()]
-    )
-
-    feature = norm.cdf(
-        x=[proposal.current_epoch for proposal in proposals.values()],
-        loc=mean,
-        scale=std_dev,
+    return _normal_cdf(
+        np.fromiter(
+            (proposal.current_epoch for proposal in proposals.values()),
+            dtype=np.float64,
+            count=len(proposals),
+        )
     )
 
-    return feature
-
 
 def h_proposal_feature_3(proposals: dict):
-    mean, std_dev = norm.fit(
-        [proposal.get_horizon() for proposal in proposals.values()]
-    )
-
-    feature = norm.cdf(
-        x=[proposal.get_horizon() for proposal in proposals.values()],
-        loc=mean,
-        scale=std_dev,
+    return _normal_cdf(
+        np.fromiter(
+            (proposal.get_horizon() for proposal in proposals.values()),
+            dtype=np.float64,
+            count=len(proposals),
+        )
     )
 
-    return feature
-
 
 def h_proposal_feature_4(proposals: dict):
-    mean, std_dev = norm.fit(
-        [proposal.allocation_per_epoch for proposal in proposals.values()]
+    return _normal_cdf(
+        np.fromiter(
+            (proposal.allocation_per_epoch for proposal in proposals.values()),
+            dtype=np.float64,
+            count=len(proposals),
+        )
     )
 
-    feature = norm.cdf(
-        x=[proposal.allocation_per_epoch for proposal in proposals.values()],
-        loc=mean,
-        scale=std_dev,
+
+def h_proposal_features(proposals: dict) -> np.ndarray:
+    """Returns every proposal feature as a matrix with one row per proposal.
+
+    This is equivalent to stacking `h_proposal_feature_0` to
+    `h_proposal_feature_4` as columns, but fits all the features in one pass.
+    """
+    raw_features = np.fromiter(
+        (
+            (
+                proposal.funds.total_funds(),
+                proposal.current_epoch,
+                proposal.get_horizon(),
+                proposal.allocation_per_epoch,
+            )
+            for proposal in proposals.values()
+        ),
+        dtype=np.dtype((np.float64, 4)),
+        count=len(proposals),
     )
 
-    return feature
+    features = np.ones(shape=(len(proposals), 5))
+    features[:, 1:] = _normal_cdf(raw_features)
+
+    return features
 
 
 def h_join_stake(wallet: Wallet, wallets: dict) -> Funds:
@@ -91,8 +101,9 @@ def h_pay_contribution(wallet: Wallet, wallets: dict) -> Funds:
     return Funds({"USD": 50})
 
 
-def h_vote_broker(wallet: Wallet, wallets: dict) -> int:
-    return rng.choice(list(wallets.keys()))
+def h_vote_broker(voters: np.ndarray, wallets: dict) -> np.ndarray:
+    """Returns a random broker for each voter to vote on."""
+    return wallet_array(wallets)[rng.integers(len(wallets), size=len(voters))]
 
 
 def h_vote_result(wallet: Wallet, wallets: dict) -> bool:
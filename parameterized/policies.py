@@ -1,11 +1,70 @@
 import numpy as np
 
-from scipy.stats import norm
-
+from collections import namedtuple
+
+from .actions import (
+    action_matrix,
+    action_width,
+    cancelled_mask,
+    draw_action_randoms,
+    membership_matrix,
+    wallet_array,
+    wallet_index,
+)
+from .rng import rng
 from .whitelist_mechanism import NoVote
 
 
-rng = np.random.default_rng(42)
+# A row of the transactions table, kept as a tuple rather than a dict to save
+# memory over long simulations
+Transaction = namedtuple(
+    "Transaction",
+    [
+        "timestep",
+        "wallet",
+        "wallet_funds_old",
+        "wallet_funds",
+        "action",
+        "proposal",
+        "proposal_funds_old",
+        "proposal_funds",
+    ],
+    defaults=(None,) * 8,
+)
+
+# The allocations per epoch a newly deployed proposal can choose from
+_allocations_per_epoch = np.array([5, 10, 15, 20])
+
+
+def _proposal_array(proposals: dict) -> np.ndarray:
+    """Returns the proposals as an object array that can be indexed by a mask."""
+    return np.fromiter(proposals.values(), dtype=object, count=len(proposals))
+
+
+def _proposal_totals(proposals: np.ndarray) -> dict:
+    """Returns the total funds of each proposal, keyed by its public key.
+
+    Within a policy, a proposal's total only changes through a transaction, so
+    the entry is updated when one is recorded. Only the proposals that some
+    wallet decided to act on need to be passed.
+    """
+    return {proposal.public: proposal.get_total_funds() for proposal in proposals}
+
+
+def _proposal_decisions(action, previous_state: dict, *args, **kwargs) -> np.ndarray:
+    """Returns the decision of every wallet for every proposal.
+
+    The decision of an action that decides once per wallet applies to every
+    proposal.
+    """
+    wallets, proposals = previous_state["wallets"], previous_state["proposals"]
+    draws = draw_action_randoms(len(wallets), action_width(action, len(proposals)))
+    decisions = action_matrix(action, wallets, proposals, draws, *args, **kwargs)
+
+    if decisions.shape[1] != len(proposals):
+        decisions = np.repeat(decisions, len(proposals), axis=1)
+
+    return decisions
 
 
 def p_free_memory(params, substep, state_history, previous_state):
@@ -13,11 +72,12 @@ def p_free_memory(params, substep, state_history, previous_state):
 
     https://community.cadcad.org/t/working-with-large-objects/215/2
     """
-    for global_variable in params["global"]:
-        state = state_history[-1]
+    global_variables = params["global"]
 
-        for substate in state:
-            substate[global_variable] = None
+    for substate in state_history[-1]:
+        for global_variable in global_variables:
+            if substate[global_variable] is not None:
+                substate[global_variable] = None
 
     return dict()
 
@@ -26,7 +86,8 @@ def p_iter_epoch(params, substep, state_history, previous_state):
     for proposal in previous_state["proposals"].values():
         proposal.iter_epoch()
 
-    print(f"Epoch: {previous_state['timestep']}")
+    if previous_state["timestep"] % params.get("log_every", 1) == 0:
+        print(f"Epoch: {previous_state['timestep']}")
 
     return dict()
 
@@ -34,25 +95,15 @@ def p_iter_epoch(params, substep, state_history, previous_state):
 def p_iter_features(params, substep, state_history, previous_state):
     wallet_feature_0 = params["wallet_feature_0"](previous_state["wallets"])
 
-    for i, wallet in enumerate(previous_state["wallets"].values()):
-        wallet.feature_vector[0] = wallet_feature_0[i]
-
-    proposal_feature_0 = params["proposal_feature_0"](previous_state["proposals"])
-    proposal_feature_1 = params["proposal_feature_1"](previous_state["proposals"])
-    proposal_feature_2 = params["proposal_feature_2"](previous_state["proposals"])
-    proposal_feature_3 = params["proposal_feature_3"](previous_state["proposals"])
-    proposal_feature_4 = params["proposal_feature_4"](previous_state["proposals"])
-
-    for i, proposal in enumerate(previous_state["proposals"].values()):
-        proposal.feature_vector = np.array(
-            [
-                proposal_feature_0[i],
-                proposal_feature_1[i],
-                proposal_feature_2[i],
-                proposal_feature_3[i],
-                proposal_feature_4[i],
-            ]
-        )
+    for wallet, feature in zip(previous_state["wallets"].values(), wallet_feature_0):
+        wallet.feature_vector[0] = feature
+
+    proposal_features = params["proposal_features"](previous_state["proposals"])
+
+    for proposal, feature_vector in zip(
+        previous_state["proposals"].values(), proposal_features
+    ):
+        proposal.feature_vector = feature_vector
 
     return dict()
 
@@ -62,46 +113,54 @@ def p_join(params, substep, state_history, previous_state):
     funds_staked = 0
     transactions = list()
 
-    for wallet in previous_state["wallets"].values():
-        proposals = np.extract(
-            params["join"](
-                wallet,
-                previous_state["wallets"],
-                previous_state["proposals"],
-                y_scale=0.05,
-            ),
-            list(previous_state["proposals"].values()),
-        )
+    # The rows of the draws and decisions follow the order of the wallets
+    wallets = wallet_array(previous_state["wallets"])
+    index = wallet_index(previous_state["wallets"])
 
-        for proposal in proposals:
-            stake = params["join_stake"](wallet, previous_state["wallets"])
+    decisions = _proposal_decisions(params["join"], previous_state, y_scale=0.05)
 
-            wallet_funds_old = wallet.funds.total_funds()
-            proposal_funds_old = (proposal.funds + proposal.stake).total_funds()
+    # Joining a cancelled or an already joined proposal has no effect
+    decisions &= ~cancelled_mask(previous_state["proposals"])
+    decisions &= ~membership_matrix(
+        index, previous_state["proposals"], "broker_agreements"
+    )
 
-            try:
-                wallet = proposal.join(wallet, stake)
-            except ValueError:
-                continue
+    proposals = _proposal_array(previous_state["proposals"])
+    proposal_totals = _proposal_totals(proposals[decisions.any(axis=0)])
 
-            wallet_funds_new = wallet.funds.total_funds()
+    for i, j in zip(*np.nonzero(decisions)):
+        wallet, proposal = wallets[i], proposals[j]
 
-            if wallet_funds_new != wallet_funds_old:
-                transaction = {
-                    "timestep": previous_state["timestep"],
-                    "wallet": wallet.public,
-                    "wallet_funds_old": wallet_funds_old,
-                    "wallet_funds": wallet_funds_new,
-                    "action": "join",
-                    "proposal": proposal.public,
-                    "proposal_funds_old": proposal_funds_old,
-                    "proposal_funds": (proposal.funds + proposal.stake).total_funds(),
-                }
+        stake = params["join_stake"](wallet, previous_state["wallets"])
 
-                transactions.append(transaction)
+        # Joining raises a ValueError when the wallet cannot afford the stake
+        if wallet.funds < stake:
+            continue
+
+        wallet_funds_old = wallet.funds.total_funds()
+        proposal_funds_old = proposal_totals[proposal.public]
+
+        wallet = proposal.join(wallet, stake)
+        wallet_funds_new = wallet.funds.total_funds()
+
+        if wallet_funds_new != wallet_funds_old:
+            proposal_totals[proposal.public] = proposal.get_total_funds()
+
+            transactions.append(
+                Transaction(
+                    previous_state["timestep"],
+                    wallet.public,
+                    wallet_funds_old,
+                    wallet_funds_new,
+                    "join",
+                    proposal.public,
+                    proposal_funds_old,
+                    proposal_totals[proposal.public],
+                )
+            )
 
-                n_joined += 1
-                funds_staked += wallet_funds_old - wallet_funds_new
+            n_joined += 1
+            funds_staked += wallet_funds_old - wallet_funds_new
 
     return {
         "n_joined": n_joined,
@@ -115,43 +174,42 @@ def p_claim(params, substep, state_history, previous_state):
     funds_claimed = 0
     transactions = list()
 
-    for wallet in previous_state["wallets"].values():
-        proposals = np.extract(
-            params["claim"](
-                wallet,
-                previous_state["wallets"],
-                previous_state["proposals"],
-                1,
-            ),
-            list(previous_state["proposals"].values()),
-        )
+    decisions = _proposal_decisions(params["claim"], previous_state, 1)
+
+    wallets = wallet_array(previous_state["wallets"])
+    proposals = _proposal_array(previous_state["proposals"])
+    proposal_totals = _proposal_totals(proposals[decisions.any(axis=0)])
+
+    for i, j in zip(*np.nonzero(decisions)):
+        wallet, proposal = wallets[i], proposals[j]
+
+        wallet_funds_old = wallet.funds.total_funds()
+        proposal_funds_old = proposal_totals[proposal.public]
+
+        try:
+            wallet = proposal.claim(wallet)
+        except ValueError:
+            "wallet unable to claim funds, proposal low on funds"
+        wallet_funds_new = wallet.funds.total_funds()
+
+        if wallet_funds_new != wallet_funds_old:
+            proposal_totals[proposal.public] = proposal.get_total_funds()
+
+            transactions.append(
+                Transaction(
+                    previous_state["timestep"],
+                    wallet.public,
+                    wallet_funds_old,
+                    wallet_funds_new,
+                    "claim",
+                    proposal.public,
+                    proposal_funds_old,
+                    proposal_totals[proposal.public],
+                )
+            )
 
-        for proposal in proposals:
-            wallet_funds_old = wallet.funds.total_funds()
-            proposal_funds_old = (proposal.funds + proposal.stake).total_funds()
-
-            try:
-                wallet = proposal.claim(wallet)
-            except ValueError:
-                "wallet unable to claim funds, proposal low on funds"
-            wallet_funds_new = wallet.funds.total_funds()
-
-            if wallet_funds_new != wallet_funds_old:
-                transaction = {
-                    "timestep": previous_state["timestep"],
-                    "wallet": wallet.public,
-                    "wallet_funds_old": wallet_funds_old,
-                    "wallet_funds": wallet_funds_new,
-                    "action": "claim",
-                    "proposal": proposal.public,
-                    "proposal_funds_old": proposal_funds_old,
-                    "proposal_funds": (proposal.funds + proposal.stake).total_funds(),
-                }
-
-                transactions.append(transaction)
-
-                n_claimed += 1
-                funds_claimed += wallet_funds_new - wallet_funds_old
+            n_claimed += 1
+            funds_claimed += wallet_funds_new - wallet_funds_old
 
     return {
         "n_claimed": n_claimed,
@@ -165,39 +223,39 @@ def p_leave(params, substep, state_history, previous_state):
     funds_claimed = 0
     transactions = list()
 
-    for wallet in previous_state["wallets"].values():
-        proposals = np.extract(
-            params["leave"](
-                wallet,
-                previous_state["wallets"],
-                previous_state["proposals"],
-            ),
-            list(previous_state["proposals"].values()),
-        )
+    decisions = _proposal_decisions(params["leave"], previous_state)
 
-        for proposal in proposals:
-            wallet_funds_old = wallet.funds.total_funds()
-            proposal_funds_old = (proposal.funds + proposal.stake).total_funds()
+    wallets = wallet_array(previous_state["wallets"])
+    proposals = _proposal_array(previous_state["proposals"])
+    proposal_totals = _proposal_totals(proposals[decisions.any(axis=0)])
 
-            wallet = proposal.leave(wallet)
-            wallet_funds_new = wallet.funds.total_funds()
+    for i, j in zip(*np.nonzero(decisions)):
+        wallet, proposal = wallets[i], proposals[j]
 
-            if wallet_funds_new != wallet_funds_old:
-                transaction = {
-                    "timestep": previous_state["timestep"],
-                    "wallet": wallet.public,
-                    "wallet_funds_old": wallet_funds_old,
-                    "wallet_funds": wallet_funds_new,
-                    "action": "leave",
-                    "proposal": proposal.public,
-                    "proposal_funds_old": proposal_funds_old,
-                    "proposal_funds": (proposal.funds + proposal.stake).total_funds(),
-                }
+        wallet_funds_old = wallet.funds.total_funds()
+        proposal_funds_old = proposal_totals[proposal.public]
 
-                transactions.append(transaction)
+        wallet = proposal.leave(wallet)
+        wallet_funds_new = wallet.funds.total_funds()
+
+        if wallet_funds_new != wallet_funds_old:
+            proposal_totals[proposal.public] = proposal.get_total_funds()
+
+            transactions.append(
+                Transaction(
+                    previous_state["timestep"],
+                    wallet.public,
+                    wallet_funds_old,
+                    wallet_funds_new,
+                    "leave",
+                    proposal.public,
+                    proposal_funds_old,
+                    proposal_totals[proposal.public],
+                )
+            )
 
-                n_left += 1
-                funds_claimed += wallet_funds_new - wallet_funds_old
+            n_left += 1
+            funds_claimed += wallet_funds_new - wallet_funds_old
 
     return {
         "n_left": n_left,
@@ -211,42 +269,44 @@ def p_pay(params, substep, state_history, previous_state):
     funds_contributed = 0
     transactions = list()
 
-    for wallet in previous_state["wallets"].values():
-        proposals = np.extract(
-            params["pay"](
-                wallet,
-                previous_state["wallets"],
-                previous_state["proposals"],
-                y_scale=0.005,
-            ),
-            list(previous_state["proposals"].values()),
-        )
+    decisions = _proposal_decisions(params["pay"], previous_state, y_scale=0.005)
+
+    # Paying into a cancelled proposal has no effect
+    decisions &= ~cancelled_mask(previous_state["proposals"])
+
+    wallets = wallet_array(previous_state["wallets"])
+    proposals = _proposal_array(previous_state["proposals"])
+    proposal_totals = _proposal_totals(proposals[decisions.any(axis=0)])
 
-        for proposal in proposals:
-            wallet_funds_old = wallet.funds.total_funds()
-            proposal_funds_old = (proposal.funds + proposal.stake).total_funds()
+    for i, j in zip(*np.nonzero(decisions)):
+        wallet, proposal = wallets[i], proposals[j]
 
-            contribution = params["pay_contribution"](wallet, previous_state["wallets"])
+        wallet_funds_old = wallet.funds.total_funds()
+        proposal_funds_old = proposal_totals[proposal.public]
 
-            wallet = proposal.pay(wallet, contribution)
-            wallet_funds_new = wallet.funds.total_funds()
+        contribution = params["pay_contribution"](wallet, previous_state["wallets"])
 
-            if wallet_funds_new != wallet_funds_old:
-                transaction = {
-                    "timestep": previous_state["timestep"],
-                    "wallet": wallet.public,
-                    "wallet_funds_old": wallet_funds_old,
-                    "wallet_funds": wallet_funds_new,
-                    "action": "pay",
-                    "proposal": proposal.public,
-                    "proposal_funds_old": proposal_funds_old,
-                    "proposal_funds": (proposal.funds + proposal.stake).total_funds(),
-                }
+        wallet = proposal.pay(wallet, contribution)
+        wallet_funds_new = wallet.funds.total_funds()
 
-                transactions.append(transaction)
+        if wallet_funds_new != wallet_funds_old:
+            proposal_totals[proposal.public] = proposal.get_total_funds()
 
-                n_paid += 1
-                funds_contributed += wallet_funds_new - wallet_funds_old
+            transactions.append(
+                Transaction(
+                    previous_state["timestep"],
+                    wallet.public,
+                    wallet_funds_old,
+                    wallet_funds_new,
+                    "pay",
+                    proposal.public,
+                    proposal_funds_old,
+                    proposal_totals[proposal.public],
+                )
+            )
+
+            n_paid += 1
+            funds_contributed += wallet_funds_new - wallet_funds_old
 
     return {
         "n_paid": n_paid,
@@ -259,27 +319,22 @@ def p_vote(params, substep, state_history, previous_state):
     n_voted = 0
     voted_yes = 0
 
-    for wallet in previous_state["wallets"].values():
-        proposals = np.extract(
-            params["vote"](
-                wallet,
-                previous_state["wallets"],
-                previous_state["proposals"],
-                1,
-            ),
-            list(previous_state["proposals"].values()),
-        )
+    decisions = _proposal_decisions(params["vote"], previous_state, 1)
 
-        for proposal in proposals:
-            broker = previous_state["wallets"][
-                params["vote_broker"](wallet, previous_state["wallets"])
-            ]
-            result = params["vote_result"](wallet, previous_state["wallets"])
+    wallets = wallet_array(previous_state["wallets"])
+    proposals = _proposal_array(previous_state["proposals"])
 
-            proposal.vote_broker(wallet, broker, result)
+    i, j = np.nonzero(decisions)
+    voters = wallets[i]
+    brokers = params["vote_broker"](voters, previous_state["wallets"])
 
-            n_voted += 1
-            voted_yes += result * 1
+    for wallet, proposal, broker in zip(voters, proposals[j], brokers):
+        result = params["vote_result"](wallet, previous_state["wallets"])
+
+        proposal.vote_broker(wallet, broker, result)
+
+        n_voted += 1
+        voted_yes += result * 1
 
     return {
         "n_voted": n_voted,
@@ -292,45 +347,70 @@ def p_deploy(params, substep, state_history, previous_state):
     funds_contributed = 0
     transactions = list()
 
-    for wallet in previous_state["wallets"].values():
-        deploy = params["deploy"](
-            wallet,
-            previous_state["wallets"],
-            previous_state["proposals"],
-            y_scale=0.01,
+    # A wallet deploys if any of its decisions is to deploy, so actions that
+    # decide once per wallet draw once, and the others draw once per proposal
+    # like any other policy and never deploy while there are no proposals
+    draws = draw_action_randoms(
+        len(previous_state["wallets"]),
+        action_width(params["deploy"], len(previous_state["proposals"])),
+    )
+
+    decisions = action_matrix(
+        params["deploy"],
+        previous_state["wallets"],
+        previous_state["proposals"],
+        draws,
+        y_scale=0.01,
+    )
+
+    deployers = [
+        wallet
+        for wallet, deploy in zip(
+            previous_state["wallets"].values(), decisions.any(axis=1)
+        )
+        if deploy
+    ]
+
+    # The feature vectors and allocations of the new proposals are drawn at once
+    n_features = [wallet.number_of_features for wallet in deployers]
+    feature_vectors = np.split(
+        rng.random(size=sum(n_features)), np.cumsum(n_features)[:-1]
+    )
+    allocations_per_epoch = rng.choice(_allocations_per_epoch, size=len(deployers))
+
+    for wallet, feature_vector, allocation_per_epoch in zip(
+        deployers, feature_vectors, allocations_per_epoch
+    ):
+        wallet_funds_old = wallet.funds.total_funds()
+        initial_funds = params["deploy_initial_funds"](
+            wallet, previous_state["wallets"]
         )
 
-        if any(deploy):
-            wallet_funds_old = wallet.funds.total_funds()
-            initial_funds = params["deploy_initial_funds"](
-                wallet, previous_state["wallets"]
-            )
+        proposal = wallet.deploy(
+            funds=initial_funds,
+            broker_whitelist=NoVote(),
+            feature_vector=feature_vector,
+            allocation_per_epoch=float(allocation_per_epoch),
+        )
 
-            proposal = wallet.deploy(
-                funds=initial_funds,
-                broker_whitelist=NoVote(),
-                feature_vector=rng.random(size=wallet.number_of_features),
-                allocation_per_epoch=float(rng.choice([5, 10, 15, 20])),
+        if proposal is not None:
+            previous_state["proposals"][proposal.public] = proposal
+
+            transactions.append(
+                Transaction(
+                    previous_state["timestep"],
+                    wallet.public,
+                    wallet_funds_old,
+                    wallet.funds.total_funds(),
+                    "deploy",
+                    proposal.public,
+                    0,
+                    proposal.funds.total_funds(),
+                )
             )
 
-            if proposal is not None:
-                previous_state["proposals"][proposal.public] = proposal
-
-                transaction = {
-                    "timestep": previous_state["timestep"],
-                    "wallet": wallet.public,
-                    "wallet_funds_old": wallet_funds_old,
-                    "wallet_funds": wallet.funds.total_funds(),
-                    "action": "deploy",
-                    "proposal": proposal.public,
-                    "proposal_funds_old": 0,
-                    "proposal_funds": proposal.funds.total_funds(),
-                }
-
-                transactions.append(transaction)
-
-                n_deployed += 1
-                funds_contributed += initial_funds.total_funds()
+            n_deployed += 1
+            funds_contributed += initial_funds.total_funds()
 
     return {
         "n_deployed": n_deployed,
@@ -344,41 +424,45 @@ def p_cancel(params, substep, state_history, previous_state):
     n_left = 0
     transactions = list()
 
-    for wallet in previous_state["wallets"].values():
-        proposals = np.extract(
-            params["cancel"](
-                wallet, previous_state["wallets"], previous_state["proposals"]
-            ),
-            list(previous_state["proposals"].values()),
-        )
+    decisions = _proposal_decisions(params["cancel"], previous_state)
 
-        for proposal in proposals:
-            proposal_funds_old = (proposal.funds + proposal.stake).total_funds()
+    wallets = wallet_array(previous_state["wallets"])
+    proposals = _proposal_array(previous_state["proposals"])
 
-            proposal.cancel(wallet.public)
+    for i, j in zip(*np.nonzero(decisions)):
+        wallet, proposal = wallets[i], proposals[j]
 
-            for broker_public in list(proposal.broker_agreements.keys()):
-                broker = previous_state["wallets"][broker_public]
+        proposal_funds_old = proposal.get_total_funds()
 
-                broker_funds_old = broker.funds.total_funds()
-                broker = proposal.leave(broker)
+        proposal.cancel(wallet.public)
 
-                transaction = {
-                    "timestep": previous_state["timestep"],
-                    "wallet": broker,
-                    "wallet_funds_old": broker_funds_old,
-                    "wallet_funds": broker.funds.total_funds(),
-                    "action": "leave",
-                    "proposal": proposal,
-                    "proposal_funds_old": proposal_funds_old,
-                    "proposal_funds": proposal.funds.total_funds(),
-                }
+        brokers = [
+            previous_state["wallets"][broker_public]
+            for broker_public in proposal.broker_agreements.keys()
+        ]
 
-                transactions.append(transaction)
+        for broker in brokers:
+            broker_funds_old = broker.funds.total_funds()
+            broker = proposal.leave(broker)
+
+            transactions.append(
+                Transaction(
+                    previous_state["timestep"],
+                    broker.public,
+                    broker_funds_old,
+                    broker.funds.total_funds(),
+                    "leave",
+                    proposal.public,
+                    proposal_funds_old,
+                    # Recorded without the stake, unlike the funds before
+                    # the cancel
+                    proposal.funds.total_funds(),
+                )
+            )
 
-                n_left += 1
+            n_left += 1
 
-            n_cancelled += 1
+        n_cancelled += 1
 
     return {
         "n_cancelled": n_cancelled,
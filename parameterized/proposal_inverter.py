@@ -1,14 +1,14 @@
+import logging
+import math
 import numpy as np
 import param as pm
-import pandas as pd
-import panel as pn
 import secrets
+import sys
 
 from collections import defaultdict
-from eth_account import Account
 
 from .agreement import BrokerAgreement, PayerAgreement
-from .funds import Funds
+from .funds import Funds, FundsMatrix, as_funds
 from .whitelist_mechanism import (
     WhitelistMechanism,
     NoVote,
@@ -20,15 +20,31 @@ from .whitelist_mechanism import (
 )
 
 
-pn.extension()
+logger = logging.getLogger(__name__)
+
+
+# Deriving the address of a private key is slow, and simulations only need
+# addresses to be unique, so random addresses are generated unless this is set.
+# Random addresses cannot be signed for with their private key
+USE_REAL_ETH_ACCOUNTS = False
 
 
 def generate_eth_account():
     priv = secrets.token_hex(32)
     private = "0x" + priv
-    public = Account.from_key(private).address
 
-    return private, public
+    if USE_REAL_ETH_ACCOUNTS:
+        # eth_account takes most of a second to import, so it is only imported
+        # once real accounts are asked for
+        from eth_account import Account
+
+        public = Account.from_key(private).address
+    else:
+        public = "0x" + secrets.token_hex(20)
+
+    # Addresses are used as keys throughout, so they are interned to make any
+    # equal copy of an address compare by identity
+    return private, sys.intern(public)
 
 
 class Wallet(pm.Parameterized):
@@ -69,7 +85,7 @@ class Wallet(pm.Parameterized):
         and that B=∅.
         """
         if self.funds < funds:
-            print("Wallet does not have sufficient funds to deploy a proposal")
+            logger.info("Wallet does not have sufficient funds to deploy a proposal")
 
             return None
 
@@ -91,19 +107,15 @@ class ProposalInverter(Wallet):
     equal for both wallets and proposals.
     """
 
-    # State
-    cancelled = pm.Boolean(
-        False,
-        doc="if the proposal has been cancelled, funds will no longer be allocated",
-    )
-    current_epoch = pm.Number(0, doc="number of epochs that have passed")
-    stake = pm.ClassSelector(Funds, default=Funds(), doc="The total broker stake")
-
-    broker_agreements = pm.Dict(
-        dict(), doc="maps each broker's public key to their broker agreement"
-    )
-    payer_agreements = pm.Dict(
-        dict(), doc="maps each payer's public key to their Payer agreement"
+    # The state is read and written throughout every epoch, so it is kept in
+    # plain attributes rather than parameters, which validate on every access.
+    # It can still be passed to the constructor like the parameters
+    _state = (
+        "cancelled",
+        "current_epoch",
+        "stake",
+        "broker_agreements",
+        "payer_agreements",
     )
 
     broker_whitelist = pm.ClassSelector(WhitelistMechanism, default=OwnerVote())
@@ -137,26 +149,86 @@ class ProposalInverter(Wallet):
         5, doc="minimum funds that a broker must stake to join in USD"
     )
 
+    _copied_parameters = (
+        "allocation_per_epoch",
+        "broker_whitelist",
+        "max_brokers",
+        "min_brokers",
+        "min_contribution",
+        "min_epochs",
+        "min_horizon",
+        "min_payers",
+        "min_stake",
+        "payer_whitelist",
+    )
+
     def __init__(self, owner: Wallet, **params):
+        state = {name: params.pop(name) for name in self._state if name in params}
+
         super().__init__(**params)
 
+        # If the proposal has been cancelled, funds will no longer be allocated
+        self.cancelled = state.get("cancelled", False)
+        # The number of epochs that have passed
+        self.current_epoch = state.get("current_epoch", 0)
+        # The total broker stake
+        self.stake = as_funds(state.get("stake", Funds()))
+
+        # Map each broker's and payer's public key to their agreement
+        self.broker_agreements = state.get("broker_agreements", dict())
+        self.payer_agreements = state.get("payer_agreements", dict())
+
+        # The funds allocated to the brokers are kept as the rows of one matrix,
+        # and those allocated to the payers as a running total, so that reading
+        # them does not have to sum over every agreement
+        self._broker_allocations = FundsMatrix()
+
+        for agreement in self.broker_agreements.values():
+            # Agreements made elsewhere are moved into this proposal's matrix
+            allocated_funds = agreement.allocated_funds
+            agreement.allocations.remove(agreement.row)
+            agreement.allocations = self._broker_allocations
+            agreement.row = self._broker_allocations.add()
+            agreement.allocated_funds = allocated_funds
+
         self.owner_address = owner.public
 
         # Manually add owner to whitelist and track owner contribution
         self.payer_whitelist.whitelist.add(owner.public)
         self.payer_agreements[owner.public] = PayerAgreement()
-        self.payer_agreements[owner.public].contributions[
-            self.current_epoch
-        ] += self.funds
+        self.payer_agreements[owner.public].contribute(self.current_epoch, self.funds)
 
         # This entry is for brokers that leave without their stake
         # Funds in this entry are all allocated to brokers
         self.payer_agreements[self.public] = PayerAgreement()
 
+        self._payer_allocated = Funds.sum(
+            agreement.allocated_funds for agreement in self.payer_agreements.values()
+        )
+
+        # The allocation to each broker per epoch, kept until the brokers or the
+        # funds change. Allocating in proportion to the unallocated funds does
+        # not change their proportions, so it is the same for every epoch
+        self._allocation_per_broker = None
+
+        # The parameters read on every epoch, join and payment are copied out
+        # of their descriptors, and copied again whenever a parameter changes
+        self._allocation_per_epoch = self.allocation_per_epoch
+        self._broker_whitelist = self.broker_whitelist
+        self._max_brokers = self.max_brokers
+        self._min_brokers = self.min_brokers
+        self._min_contribution = self.min_contribution
+        self._min_epochs = self.min_epochs
+        self._min_horizon = self.min_horizon
+        self._min_payers = self.min_payers
+        self._min_stake = self.min_stake
+        self._payer_whitelist = self.payer_whitelist
+        self.param.watch(self._copy_parameters, list(self._copied_parameters))
+
         self.started = self.__minimum_conditions_met()
 
         if not self.started:
-            print(
+            logger.info(
                 "ProposalInverter :: proposal deployed without meeting minimum conditions"
             )
 
@@ -172,42 +244,46 @@ class ProposalInverter(Wallet):
         when the contract is self-destructed.
         """
         if owner_address != self.owner_address:
-            print("Only the owner can cancel a proposal")
+            logger.info("Only the owner can cancel a proposal")
         elif self.cancelled:
-            print("Proposal has already been cancelled")
+            logger.info("Proposal has already been cancelled")
         else:
             allocated_funds = self.get_allocated_funds()
             allocation = self.get_allocation()
 
             # This is equivalent to `allocation_per_epoch * min_horizon` except
             # it factors into account the case where the total funds is lower
-            # than the minimum horizon
-            horizon_funds = Funds()
-            for epoch in range(self.min_horizon):
-                horizon_funds += min(
-                    allocation, self.funds - allocated_funds - horizon_funds
-                )
+            # than the minimum horizon. The allocation is in proportion to the
+            # unallocated funds, so one is always a multiple of the other
+            horizon_funds = min(
+                allocation * self._min_horizon, self.funds - allocated_funds
+            )
+
+            # The funds that remain once the brokers are paid out are returned
+            # in proportion to the contributions
+            remaining_funds = self.funds - allocated_funds - horizon_funds
+            total_funds = self.funds.total_funds()
 
             staking_bonus = Funds()
             for public, agreement in self.payer_agreements.items():
-                funder_funds = agreement.total_contributions()
+                returns = remaining_funds * (
+                    agreement.total_contributions() / total_funds
+                )
 
                 if public == self.public:
-                    staking_bonus += (self.funds - allocated_funds - horizon_funds) * (
-                        funder_funds / self.funds.total_funds()
-                    )
+                    staking_bonus += returns
                 else:
                     # The funder returns are based on the amount that funder contributed
-                    agreement.allocated_funds += (
-                        self.funds - allocated_funds - horizon_funds
-                    ) * (funder_funds / self.funds.total_funds())
+                    agreement.allocated_funds += returns
+                    self._payer_allocated += returns
 
-            for agreement in self.broker_agreements.values():
-                agreement.allocated_funds += (
-                    horizon_funds + staking_bonus
-                ) / self.get_number_of_brokers()
+            if self.get_number_of_brokers() > 0:
+                self._broker_allocations.allocate(
+                    (horizon_funds + staking_bonus) / self.get_number_of_brokers()
+                )
 
             self.cancelled = True
+            self._allocation_per_broker = None
 
     def claim(self, wallet: Wallet):
         """
@@ -230,31 +306,37 @@ class ProposalInverter(Wallet):
         restrict access to the set of brokers. These lists may be managed by the owner, the payers, and/or the brokers;
         however, scoping an addition access control scheme is out of scope at this time.
         """
-        stake = Funds(stake)
+        stake = as_funds(stake)
 
         if broker.funds < stake:
             raise ValueError("Failed to add broker due to insufficient funds")
-        elif broker.public in self.broker_agreements.keys():
-            print("Failed to add broker, broker already has a stake in this proposal")
-        elif self.get_number_of_brokers() + 1 > self.max_brokers:
-            print("Failed to add broker, maximum number of brokers reached")
-        elif stake.total_funds() < self.min_stake:
-            print("Failed to add broker, minimum stake not met")
+        elif broker.public in self.broker_agreements:
+            logger.info(
+                "Failed to add broker, broker already has a stake in this proposal"
+            )
+        elif self.get_number_of_brokers() + 1 > self._max_brokers:
+            logger.info("Failed to add broker, maximum number of brokers reached")
+        elif stake.total_funds() < self._min_stake:
+            logger.info("Failed to add broker, minimum stake not met")
         elif self.cancelled:
-            print("Failed to add broker, proposal has been cancelled")
-        elif self.broker_whitelist.in_whitelist(broker):
+            logger.info("Failed to add broker, proposal has been cancelled")
+        elif self._broker_whitelist.in_whitelist(broker):
             broker.funds -= stake
             self.stake += stake
 
             self.broker_agreements[broker.public] = BrokerAgreement(
+                allocations=self._broker_allocations,
                 epoch_joined=self.current_epoch,
-                stake=stake,
+                # The stake is kept, so it is copied in case the caller
+                # changes it afterwards
+                stake=Funds(stake),
             )
 
             broker.joined.add(self.public)
+            self._allocation_per_broker = None
         else:
             self.broker_whitelist.add_waitlist(broker)
-            print("Warning: broker not yet whitelisted, added to waitlist")
+            logger.info("Warning: broker not yet whitelisted, added to waitlist")
 
         return broker
 
@@ -270,11 +352,12 @@ class ProposalInverter(Wallet):
         broker_agreement = self.broker_agreements.get(broker.public)
 
         if broker_agreement is None:
-            print("Broker is not part of this proposal")
+            logger.info("Broker is not part of this proposal")
         else:
             if (
                 self.cancelled
-                or self.current_epoch - broker_agreement.epoch_joined >= self.min_epochs
+                or self.current_epoch - broker_agreement.epoch_joined
+                >= self._min_epochs
             ):
                 stake = broker_agreement.stake
                 broker.funds += stake
@@ -284,13 +367,15 @@ class ProposalInverter(Wallet):
                 self.funds += stake
                 self.stake -= stake
 
-                self.payer_agreements[self.public].contributions[
-                    self.current_epoch
-                ] = stake
+                # The forfeited stake is added to any other stakes forfeited in
+                # this epoch, so that every one of them counts in a cancel
+                self.payer_agreements[self.public].contribute(self.current_epoch, stake)
 
             broker = self.claim(broker)
             broker.joined.discard(self.public)
             del self.broker_agreements[broker.public]
+            self._broker_allocations.remove(broker_agreement.row)
+            self._allocation_per_broker = None
 
         return broker
 
@@ -303,29 +388,28 @@ class ProposalInverter(Wallet):
         Furthermore, the Horizon H is increased
         H+ = (R + ΔF)/ ΔA = H + (ΔF/ΔA)
         """
-        tokens = Funds(tokens)
+        tokens = as_funds(tokens)
 
         if payer.funds < tokens:
-            print("Payer does not have sufficient funds")
-        elif tokens.total_funds() < self.min_contribution:
-            print("Payer contribution is lower than minimum contribution")
+            logger.info("Payer does not have sufficient funds")
+        elif tokens.total_funds() < self._min_contribution:
+            logger.info("Payer contribution is lower than minimum contribution")
         elif self.cancelled:
-            print("Proposal has been cancelled, cannot add funds")
-        elif self.payer_whitelist.in_whitelist(payer):
+            logger.info("Proposal has been cancelled, cannot add funds")
+        elif self._payer_whitelist.in_whitelist(payer):
 
-            if payer.public not in self.payer_agreements.keys():
+            if payer.public not in self.payer_agreements:
                 self.payer_agreements[payer.public] = PayerAgreement()
                 payer.paid.add(self.public)
 
-            self.payer_agreements[payer.public].contributions[
-                self.current_epoch
-            ] += tokens
+            self.payer_agreements[payer.public].contribute(self.current_epoch, tokens)
 
             payer.funds -= tokens
             self.funds += tokens
+            self._allocation_per_broker = None
         else:
             self.payer_whitelist.add_waitlist(payer)
-            print("Payer not yet whitelisted, added to waitlist")
+            logger.info("Payer not yet whitelisted, added to waitlist")
 
         return payer
 
@@ -352,18 +436,29 @@ class ProposalInverter(Wallet):
         indicative of a failure on the part of the payer. An example policy would be to allow forced cancel
         when n < nmin and H < H min, and possibly only if this is the case more multiple epochs.
         """
-        for epoch in range(n_epochs):
-            if not self.cancelled:
-                if not self.started:
-                    self.started = self.__minimum_conditions_met()
+        # Nothing in an epoch depends on the epoch number, so the parameter is
+        # only updated once, and the loop stops as soon as nothing is left to do
+        epoch = 0
 
-                if self.started:
-                    if not self.__minimum_conditions_met():
-                        self.cancel(self.owner_address)
-                    else:
-                        self.__allocate_funds()
+        while epoch < n_epochs and not self.cancelled:
+            conditions_met = self.__minimum_conditions_met()
+            epochs_passed = 1
 
-            self.current_epoch += 1
+            if not self.started:
+                self.started = conditions_met
+
+            if self.started:
+                if not conditions_met:
+                    self.cancel(self.owner_address)
+                else:
+                    # Allocate every epoch that is certain to meet the minimum
+                    # conditions at once
+                    epochs_passed = min(n_epochs - epoch, self.__stable_epochs())
+                    self.__allocate_funds(epochs_passed)
+
+            epoch += epochs_passed
+
+        self.current_epoch += n_epochs
 
     def get_allocation(self):
         """
@@ -375,25 +470,13 @@ class ProposalInverter(Wallet):
             self.funds.total_funds() - self.get_total_allocated_funds()
         )
 
-        return self.allocation_per_epoch * unallocated_funds / total_unallocated_funds
+        return self._allocation_per_epoch * unallocated_funds / total_unallocated_funds
 
     def get_allocated_funds(self):
         """
         Returns the total unclaimed allocated funds in their native tokens.
         """
-        broker_allocated = sum(
-            [
-                agreement.allocated_funds
-                for agreement in self.broker_agreements.values()
-            ],
-            start=Funds(),
-        )
-        payer_allocated = sum(
-            [agreement.allocated_funds for agreement in self.payer_agreements.values()],
-            start=Funds(),
-        )
-
-        return broker_allocated + payer_allocated
+        return self._broker_allocations.total() + self._payer_allocated
 
     def get_horizon(self):
         """
@@ -401,7 +484,13 @@ class ProposalInverter(Wallet):
         """
         return (
             self.funds.total_funds() - self.get_total_allocated_funds()
-        ) / self.allocation_per_epoch
+        ) / self._allocation_per_epoch
+
+    def get_total_funds(self):
+        """
+        Returns the funds and the broker stake converted into USD.
+        """
+        return self.funds.total_funds() + self.stake.total_funds()
 
     def get_number_of_brokers(self):
         return len(self.broker_agreements)
@@ -418,29 +507,34 @@ class ProposalInverter(Wallet):
         Returns the total unclaimed allocated funds from all broker and payer
         agreements converted into USD.
         """
-        broker_allocated = sum(
-            [
-                agreement.total_allocated()
-                for agreement in self.broker_agreements.values()
-            ]
-        )
-        payer_allocated = sum(
-            [
-                agreement.total_allocated()
-                for agreement in self.payer_agreements.values()
-            ]
+        return (
+            self._broker_allocations.total().total_funds()
+            + self._payer_allocated.total_funds()
         )
 
-        return broker_allocated + payer_allocated
-
-    def __allocate_funds(self):
+    def __allocate_funds(self, n_epochs: int = 1):
         """
-        Allocates funds for one epoch to all the brokers.
+        Allocates funds for a number of epochs to all the brokers.
         """
-        allocation_per_broker = self.get_allocation() / self.get_number_of_brokers()
+        # With no brokers to allocate to, the funds stay unallocated
+        if not self.broker_agreements:
+            return
 
-        for agreement in self.broker_agreements.values():
-            agreement.allocated_funds += allocation_per_broker
+        if self._allocation_per_broker is None:
+            self._allocation_per_broker = (
+                self.get_allocation() / self.get_number_of_brokers()
+            )
+
+        self._broker_allocations.allocate(self._allocation_per_broker * n_epochs)
+
+    def __stable_epochs(self):
+        """
+        Returns the number of epochs, starting with the current one, for which
+        the minimum conditions are certain to stay met if nothing else changes.
+        Each epoch allocates funds for one epoch, which lowers the horizon by
+        one, and one epoch is left out in case of rounding errors.
+        """
+        return max(1, math.floor(self.get_horizon() - self._min_horizon))
 
     def __claim_broker_funds(self, broker: Wallet):
         """
@@ -453,15 +547,15 @@ class ProposalInverter(Wallet):
         broker_agreement = self.broker_agreements.get(broker.public)
 
         if broker_agreement is None:
-            print("Broker is not part of this proposal, no funds are claimed")
+            logger.info("Broker is not part of this proposal, no funds are claimed")
         else:
-            claim = broker_agreement.allocated_funds
+            claim = self._broker_allocations.pop(broker_agreement.row)
 
-            for token, n_tokens in claim.items():
-                broker_agreement.allocated_funds[token] = 0
-                broker_agreement.claimed_funds[token] += n_tokens
-                broker.funds[token] += n_tokens
-                self.funds[token] -= n_tokens
+            broker_agreement.claimed_funds += claim
+            broker.funds += claim
+            self.funds = self.funds.withdraw(claim)
+
+            self._allocation_per_broker = None
 
         return broker
 
@@ -473,17 +567,37 @@ class ProposalInverter(Wallet):
         payer_agreement = self.payer_agreements.get(payer.public)
 
         if payer_agreement is None:
-            print("Payer is not part of this proposal")
+            logger.info("Payer is not part of this proposal")
         else:
             claim = payer_agreement.allocated_funds
 
             payer_agreement.allocated_funds = Funds()
             payer_agreement.claimed_funds += claim
             payer.funds += claim
-            self.funds -= claim
+            self.funds = self.funds.withdraw(claim)
+
+            # Subtracting the claim from the running total could leave rounding
+            # errors below zero, so it is summed again from the agreements
+            self._payer_allocated = Funds.sum(
+                agreement.allocated_funds
+                for agreement in self.payer_agreements.values()
+            )
+            self._allocation_per_broker = None
 
         return payer
 
+    def _copy_parameters(self, *events):
+        """
+        Copies each changed parameter into the plain attribute of the same
+        name with a leading underscore, which is set in `__init__`, and clears
+        the cached values that depend on the parameters.
+        """
+        for event in events:
+            setattr(self, "_" + event.name, event.new)
+
+        # The allocation per broker depends on the allocation per epoch
+        self._allocation_per_broker = None
+
     def __minimum_conditions_met(self):
         """
         Checks if the proposal currently meets the minimum conditions. The
@@ -491,8 +605,10 @@ class ProposalInverter(Wallet):
         - If the specified minimum number of payers has been met
         - If the specified minimum horizon has been met
         """
-        min_brokers_met = self.get_number_of_brokers() >= self.min_brokers
-        min_payers_met = len(self.payer_agreements.keys()) >= self.min_payers
-        min_horizon_met = self.get_horizon() >= self.min_horizon
-
-        return min_brokers_met and min_payers_met and min_horizon_met
+        # The conditions are checked from the cheapest, so that the horizon is
+        # only computed if the other conditions are met
+        return (
+            self.get_number_of_brokers() >= self._min_brokers
+            and len(self.payer_agreements) >= self._min_payers
+            and self.get_horizon() >= self._min_horizon
+        )
@@ -0,0 +1,11 @@
+import numpy as np
+
+
+# The simulation draws every random number from this generator, so that the
+# modules share one stream instead of each seeding an identical one
+rng = np.random.default_rng(42)
+
+
+def seed(seed: int):
+    """Reseeds the shared generator in place, keeping existing references valid."""
+    rng.bit_generator.state = np.random.default_rng(seed).bit_generator.state
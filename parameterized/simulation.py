@@ -13,9 +13,9 @@ import policies
 import state_updates
 
 from proposal_inverter import Wallet
+from rng import rng
 
 
-rng = np.random.default_rng(42)
 pd.options.plotting.backend = "plotly"
 
 
@@ -29,7 +29,7 @@ initial_state = {
     # Global variables
     "wallets": dict(),
     "proposals": dict(),
-    "transactions": list(),  # columns=["timestep", "wallet", "wallet_funds", "action", "proposal", "proposal_funds"]
+    "transactions": list(),  # rows of policies.Transaction
     # Distribution of agent actions
     "join": 0,
     "claim": 0,
@@ -56,12 +56,12 @@ for funds in funds_distribution:
 
     initial_state["wallets"][wallet.public] = wallet
     initial_state["transactions"].append(
-        {
-            "timestep": 0,
-            "wallet": wallet.public,
-            "wallet_funds": wallet.funds.total_funds(),
-            "action": "initialize",
-        }
+        policies.Transaction(
+            timestep=0,
+            wallet=wallet.public,
+            wallet_funds=wallet.funds.total_funds(),
+            action="initialize",
+        )
     )
 
 
@@ -81,7 +81,12 @@ system_params = {
     "vote_broker": [hyperparameters.h_vote_broker],
     "vote_result": [hyperparameters.h_vote_result],
     "deploy_initial_funds": [hyperparameters.h_deploy_initial_funds],
+    # Wallet and proposal feature vectors
+    "wallet_feature_0": [hyperparameters.h_wallet_feature_0],
+    "proposal_features": [hyperparameters.h_proposal_features],
     "global": [["wallets", "proposals", "transactions"]],
+    # Print the epoch every this many timesteps
+    "log_every": [10],
 }
 
 
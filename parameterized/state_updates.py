@@ -2,19 +2,22 @@ from .funds import Funds
 
 
 def s_transactions(params, substep, state_history, previous_state, policy_input):
-    return "transactions", previous_state["transactions"] + policy_input["transactions"]
+    # The transactions are a global variable whose history is freed, so they
+    # are extended in place instead of being copied on every substep
+    transactions = previous_state["transactions"]
+    transactions.extend(policy_input["transactions"])
+
+    return "transactions", transactions
 
 
 def s_total_funds(params, substep, state_history, previous_state, policy_input):
-    wallet_funds = sum(
-        [wallet.funds for wallet in previous_state["wallets"].values()], Funds()
+    wallet_funds = Funds.sum(
+        wallet.funds for wallet in previous_state["wallets"].values()
     )
-    proposal_funds = sum(
-        [
-            proposal.funds + proposal.stake
-            for proposal in previous_state["proposals"].values()
-        ],
-        Funds(),
+    proposal_funds = Funds.sum(
+        funds
+        for proposal in previous_state["proposals"].values()
+        for funds in (proposal.funds, proposal.stake)
     )
 
     return "total_funds", wallet_funds.total_funds() + proposal_funds.total_funds()
@@ -23,8 +26,8 @@ def s_total_funds(params, substep, state_history, previous_state, policy_input):
 def s_wallet_funds(params, substep, state_history, previous_state, policy_input):
     return (
         "wallet_funds",
-        sum(
-            [wallet.funds for wallet in previous_state["wallets"].values()], Funds()
+        Funds.sum(
+            wallet.funds for wallet in previous_state["wallets"].values()
         ).total_funds(),
     )
 
@@ -32,9 +35,8 @@ def s_wallet_funds(params, substep, state_history, previous_state, policy_input)
 def s_proposal_funds(params, substep, state_history, previous_state, policy_input):
     return (
         "proposal_funds",
-        sum(
-            [proposal.funds for proposal in previous_state["proposals"].values()],
-            Funds(),
+        Funds.sum(
+            proposal.funds for proposal in previous_state["proposals"].values()
         ).total_funds(),
     )
 
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from parameterized import actions, policies
+from parameterized.proposal_inverter import Wallet
+from parameterized.whitelist_mechanism import NoVote
+
+
+@pytest.fixture
+def wallets():
+    rng = np.random.default_rng(0)
+    wallets = dict()
+
+    for funds in [100, 200, 400, 800, 1600]:
+        wallet = Wallet({"USD": funds})
+        wallet.feature_vector = rng.uniform(size=wallet.number_of_features)
+        wallets[wallet.public] = wallet
+
+    return wallets
+
+
+@pytest.fixture
+def proposals(wallets):
+    rng = np.random.default_rng(1)
+    proposals = dict()
+
+    for wallet in list(wallets.values())[:3]:
+        proposal = wallet.deploy(
+            {"USD": 50},
+            broker_whitelist=NoVote(),
+            feature_vector=rng.uniform(size=wallet.number_of_features),
+        )
+        proposals[proposal.public] = proposal
+
+    # The last wallet joins the first proposal and funds the second
+    wallet = list(wallets.values())[-1]
+    list(proposals.values())[0].join(wallet, {"USD": 10})
+    list(proposals.values())[1].pay(wallet, {"USD": 10})
+
+    return proposals
+
+
+@pytest.mark.parametrize(
+    "action, args",
+    [
+        (actions.a_static_1_percent, ()),
+        (actions.a_static_50_percent, ()),
+        (actions.a_dynamic_joined, (0.5,)),
+        (actions.a_dynamic_funded, (0.5,)),
+        (actions.a_decreasing_linear, (0.5,)),
+        (actions.a_increasing_linear, (0.5,)),
+        (actions.a_normal, (0.5,)),
+        (actions.a_probability, (0.5,)),
+    ],
+)
+def test_action_matrix(wallets, proposals, action, args):
+    """
+    Evaluating an action for all wallets at once makes the same decisions as
+    calling it for each wallet with the same draws.
+    """
+    width = actions.action_width(action, len(proposals))
+    draws = np.random.default_rng(2).random(size=(len(wallets), width))
+
+    decisions = actions.action_matrix(action, wallets, proposals, draws, *args)
+    expected = np.array(
+        [
+            action(wallet, wallets, proposals, *args, draws=wallet_draws)
+            for wallet, wallet_draws in zip(wallets.values(), draws)
+        ]
+    )
+
+    assert decisions.shape == draws.shape
+    assert np.array_equal(decisions, expected)
+
+
+def test_action_matrix_shape(wallets, proposals):
+    draws = np.zeros(shape=(len(wallets), len(proposals)))
+
+    with pytest.raises(ValueError):
+        actions.action_matrix(actions.a_normal, wallets, proposals, draws)
+
+
+def test_membership_matrix(wallets, proposals):
+    index = actions.wallet_index(wallets)
+    members = actions.membership_matrix(index, proposals, "broker_agreements")
+
+    # Only the last wallet has joined a proposal, the first one
+    assert members.shape == (len(wallets), len(proposals))
+    assert members.sum() == 1
+    assert members[-1, 0]
+
+
+def test_per_wallet_action_in_policy(wallets, proposals):
+    """
+    An action that decides once per wallet applies its decision to every
+    proposal of a per-proposal policy.
+    """
+    state = {"timestep": 0, "wallets": wallets, "proposals": proposals}
+    decisions = policies._proposal_decisions(actions.a_normal, state, 0.5)
+
+    assert decisions.shape == (len(wallets), len(proposals))
+    assert np.all(decisions == decisions[:, :1])
+
+    policies.p_leave({"leave": actions.a_normal}, 0, [], state)
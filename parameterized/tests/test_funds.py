@@ -1,6 +1,6 @@
 import pytest
 
-from parameterized.funds import Funds
+from parameterized.funds import Funds, FundsMatrix
 
 
 @pytest.fixture
@@ -27,6 +27,22 @@ def test_convert_XYZ_to_ABC(funds):
     assert funds.convert("XYZ", "ABC", 42) == 2688
 
 
+def test_total_funds(funds):
+    assert funds.total_funds() == 63
+    assert funds.total_funds("ABC") == 42
+    assert (funds + {"XYZ": 1}).total_funds() == 159
+
+
+def test_total_funds_cache(funds):
+    assert funds.total_funds() == 63
+
+    funds["ABC"] = 2
+    assert funds.total_funds() == 3
+
+    Funds(price={"ABC": 3})
+    assert funds.total_funds() == 6
+
+
 def test_add(funds):
     assert funds + Funds() == {"ABC": 42}
     assert funds + {"ABC": 1, "XYZ": 2} == {"ABC": 43, "XYZ": 2}
@@ -110,6 +126,9 @@ def test_rdiv(funds):
     with pytest.raises(ValueError):
         -1 / funds
 
+    with pytest.raises(ZeroDivisionError):
+        1 / Funds({"ABC": 0})
+
 
 def test_lt(funds):
     assert not funds < {"ABC": 40}
@@ -153,6 +172,16 @@ def test_gt(funds):
     assert not funds > {"XYZ": 1}
 
 
+def test_compare_new_token(funds):
+    arr = funds._arr
+
+    assert funds < {"DEF": 1}
+    assert not funds == {"DEF": 1}
+
+    # Comparing against a token registered later leaves the balances as is
+    assert funds._arr is arr
+
+
 def test_getitem(funds):
     assert funds["ABC"] == 42
     assert funds["XYZ"] == 0
@@ -163,3 +192,55 @@ def test_setitem(funds):
 
     assert funds["ABC"] == 42
     assert funds["XYZ"] == 1
+
+
+def test_withdraw(funds):
+    assert funds.withdraw({"ABC": 2}) == {"ABC": 40}
+    assert funds.withdraw({"ABC": 42 + 1e-12})["ABC"] < 0
+
+    # Only the tokens being added or subtracted are checked for a negative
+    # balance
+    dust = funds.withdraw({"ABC": 42 + 1e-12})
+
+    assert dust + {"XYZ": 1} == {"XYZ": 1}
+    assert dust - {"XYZ": 0} == {"XYZ": 0}
+
+    with pytest.raises(ValueError):
+        dust + {"ABC": 0}
+
+
+def test_sum(funds):
+    assert Funds.sum([]) == {}
+    assert Funds.sum([funds, {"USD": 1}, funds]) == {"ABC": 84, "USD": 1}
+    assert funds == {"ABC": 42}
+
+
+def test_funds_matrix(funds):
+    matrix = FundsMatrix()
+    first, second = matrix.add(), matrix.add()
+
+    matrix[first] = funds
+    matrix.allocate({"USD": 10})
+
+    assert matrix[first] == {"ABC": 42, "USD": 10}
+    assert matrix[second] == {"USD": 10}
+    assert matrix.total() == {"ABC": 42, "USD": 20}
+
+    assert matrix.pop(second) == {"USD": 10}
+    assert matrix[second] == {"USD": 0}
+
+    # Removed rows are emptied and reused
+    matrix.remove(first)
+
+    assert matrix.add() == first
+    assert matrix[first] == {"ABC": 0, "USD": 0}
+    assert matrix.total() == {"USD": 0}
+
+    with pytest.raises(ValueError):
+        matrix.allocate({"USD": -1})
+
+    # A row left below zero in another token does not fail the allocation
+    matrix[first] = {"ABC": -1e-12}
+    matrix.allocate({"USD": 1})
+
+    assert matrix[first] == {"USD": 1}
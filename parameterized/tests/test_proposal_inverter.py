@@ -1,5 +1,9 @@
+import copy
+import pickle
 import pytest
 
+from parameterized.agreement import BrokerAgreement
+from parameterized.funds import Funds
 from parameterized.proposal_inverter import Wallet, ProposalInverter
 from parameterized.whitelist_mechanism import NoVote, OwnerVote
 
@@ -39,6 +43,68 @@ def payer():
     return payer
 
 
+def test_deploy_state(owner, broker1):
+    """
+    The state of a proposal can be given when it is deployed.
+    """
+    agreement = BrokerAgreement()
+    agreement.allocated_funds = {"USD": 5}
+
+    inverter = owner.deploy(
+        {"USD": 500},
+        broker_whitelist=NoVote(),
+        current_epoch=3,
+        stake={"USD": 10},
+        broker_agreements={broker1.public: agreement},
+    )
+
+    assert inverter.current_epoch == 3
+    assert inverter.stake == {"USD": 10}
+    assert inverter.get_number_of_brokers() == 1
+    assert inverter.get_allocated_funds() == {"USD": 5}
+
+    broker1 = inverter.claim(broker1)
+
+    assert broker1.funds == {"USD": 105}
+    assert agreement.allocated_funds == {"USD": 0}
+
+
+@pytest.mark.parametrize(
+    "clone", [copy.deepcopy, lambda inverter: pickle.loads(pickle.dumps(inverter))]
+)
+def test_clone(inverter, broker1, clone):
+    """
+    A proposal can be deep copied and pickled, as cadCAD copies the state.
+    """
+    broker1 = inverter.join(broker1, {"USD": 10})
+    inverter.iter_epoch(5)
+
+    cloned = clone(inverter)
+
+    assert cloned.current_epoch == 5
+    assert cloned.get_number_of_brokers() == 1
+    assert cloned.get_allocated_funds() == inverter.get_allocated_funds()
+
+    # The clone allocates to its own copy of the agreements
+    cloned.iter_epoch()
+    agreement = cloned.broker_agreements[broker1.public]
+
+    assert agreement.allocated_funds == cloned.get_allocated_funds()
+    assert inverter.get_allocated_funds() < cloned.get_allocated_funds()
+
+
+def test_clone_parameter_changed(inverter):
+    """
+    The parameters of a copied proposal are still copied out of their
+    descriptors when they change, without affecting the original.
+    """
+    cloned = copy.deepcopy(inverter)
+    cloned.min_horizon = 3
+
+    assert cloned._min_horizon == 3
+    assert inverter._min_horizon == 7
+
+
 def test_claim(inverter, broker1, broker2):
     """
     Test that the brokers receive the correct amounts of funds when they claim
@@ -126,6 +192,25 @@ def test_leave(inverter, broker1, broker2):
     assert broker2.funds == {"USD": 300}
 
 
+def test_leave_same_epoch(inverter, broker1, broker2):
+    """
+    The stakes of brokers that leave early in the same epoch are all recorded
+    as contributions to the proposal.
+    """
+    broker1 = inverter.join(broker1, {"USD": 10})
+    broker2 = inverter.join(broker2, {"USD": 20})
+
+    inverter.iter_epoch(5)
+
+    broker1 = inverter.leave(broker1)
+    broker2 = inverter.leave(broker2)
+
+    agreement = inverter.payer_agreements[inverter.public]
+
+    assert agreement.contributions[5] == {"USD": 30}
+    assert agreement.total_contributions() == pytest.approx(30)
+
+
 def test_pay(inverter, payer):
     """
     Payer contributes more than minimum contribution and is accepted.
@@ -146,6 +231,30 @@ def test_pay_lower_than_minimum(inverter, payer):
     assert inverter.funds == {"USD": 500}
 
 
+def test_pay_minimum_changed(inverter, payer):
+    """
+    Changing the minimum contribution applies to the following payments.
+    """
+    inverter.min_contribution = 50
+    payer = inverter.pay(payer, {"USD": 25})
+
+    assert payer.funds == {"USD": 100}
+    assert inverter.funds == {"USD": 500}
+
+
+def test_allocation_per_epoch_changed(inverter, broker1):
+    """
+    Changing the allocation per epoch applies to the following epochs.
+    """
+    broker1 = inverter.join(broker1, {"USD": 10})
+
+    inverter.iter_epoch()
+    inverter.allocation_per_epoch = 50
+    inverter.iter_epoch()
+
+    assert inverter.get_total_allocated_funds() == pytest.approx(60)
+
+
 def test_get_allocated_funds(inverter, broker1, broker2):
     assert inverter.get_allocated_funds() == {}
 
@@ -167,6 +276,80 @@ def test_get_allocated_funds(inverter, broker1, broker2):
     assert inverter.get_allocated_funds() == {"USD": 300}
 
 
+def test_iter_epoch_batched(owner, broker1, broker2):
+    """
+    Iterating over many epochs at once gives the same result as iterating over
+    them one at a time, including the epoch at which the proposal is cancelled.
+    """
+    batched = owner.deploy({"USD": 300}, broker_whitelist=NoVote())
+    stepped = owner.deploy({"USD": 300}, broker_whitelist=NoVote())
+
+    batched.join(broker1, {"USD": 10})
+    stepped.join(broker2, {"USD": 10})
+
+    # The horizon drops below the minimum horizon in the 25th epoch
+    for n_epochs in [23, 1, 1, 15]:
+        batched.iter_epoch(n_epochs)
+
+        for epoch in range(n_epochs):
+            stepped.iter_epoch()
+
+        assert batched.current_epoch == stepped.current_epoch
+        assert batched.cancelled == stepped.cancelled
+        assert batched.get_total_allocated_funds() == pytest.approx(
+            stepped.get_total_allocated_funds()
+        )
+
+    assert batched.cancelled
+
+
+def test_iter_epoch_without_brokers(owner):
+    """
+    A proposal that can start without brokers does not allocate any funds.
+    """
+    inverter = owner.deploy({"USD": 500}, min_brokers=0)
+    inverter.iter_epoch(5)
+
+    assert inverter.started
+    assert inverter.current_epoch == 5
+    assert inverter.get_total_allocated_funds() == 0
+
+
+def test_allocated_funds_totals(owner, inverter, broker1, broker2, payer):
+    """
+    The running totals of the allocated funds match the sum over the agreements
+    after every kind of change to the allocations.
+    """
+
+    def assert_totals_match():
+        agreements = [
+            *inverter.broker_agreements.values(),
+            *inverter.payer_agreements.values(),
+        ]
+        allocated = Funds.sum(agreement.allocated_funds for agreement in agreements)
+
+        assert inverter.get_allocated_funds() == allocated
+        assert inverter.get_total_allocated_funds() == pytest.approx(
+            sum([agreement.total_allocated() for agreement in agreements])
+        )
+
+    broker1 = inverter.join(broker1, {"USD": 50})
+    broker2 = inverter.join(broker2, {"USD": 100})
+    payer = inverter.pay(payer, {"USD": 30})
+    inverter.iter_epoch(15)
+    assert_totals_match()
+
+    broker1 = inverter.claim(broker1)
+    assert_totals_match()
+
+    inverter.cancel(owner.public)
+    assert_totals_match()
+
+    broker2 = inverter.leave(broker2)
+    payer = inverter.claim(payer)
+    assert_totals_match()
+
+
 def test_cancel(owner, inverter, broker1, broker2):
     # Add brokers (each with a different initial stake)
     broker1 = inverter.join(broker1, {"USD": 50})
@@ -203,14 +386,39 @@ def test_cancel(owner, inverter, broker1, broker2):
     assert inverter.funds == {"USD": 0}
 
 
-def test_forced_cancel(broker1):
+@pytest.mark.parametrize("deposit", [40, 65, 300])
+def test_cancel_horizon_funds(owner, broker1, deposit):
+    """
+    The funds allocated to the brokers for the minimum horizon on cancellation
+    match allocating them one epoch at a time.
+    """
+    inverter = owner.deploy({"USD": deposit}, broker_whitelist=NoVote())
+    broker1 = inverter.join(broker1, {"USD": 10})
+    inverter.iter_epoch(3)
+
+    allocated_funds = inverter.get_allocated_funds()
+    allocation = inverter.get_allocation()
+    horizon_funds = Funds()
+    for epoch in range(inverter.min_horizon):
+        horizon_funds += min(
+            allocation, inverter.funds - allocated_funds - horizon_funds
+        )
+
+    broker_funds = inverter.broker_agreements[broker1.public].allocated_funds
+    inverter.cancel(owner.public)
+
+    assert inverter.broker_agreements[
+        broker1.public
+    ].total_allocated() == pytest.approx((broker_funds + horizon_funds).total_funds())
+
+
+def test_forced_cancel(owner, broker1):
     """
     Cancellation occurs when the inverter is below the minimum horizon and all brokers leave. In this case, there
     are no brokers to allocate the funds to, so when the forced cancel is triggered, all funds should be returned to the
     owner.
     """
     # Deploy proposal inverter
-    owner = Wallet(funds={"USD": 1000})
     inverter = owner.deploy({"USD": 100}, broker_whitelist=NoVote())
 
     # Add broker
@@ -254,3 +462,14 @@ def test_owner_whitelist(owner, broker1, payer):
 
     assert broker1.funds == {"USD": 90}
     assert inverter.get_number_of_brokers() == 0
+
+
+def test_whitelist_changed(inverter, broker1):
+    """
+    Changing the broker whitelist applies to the following joins.
+    """
+    inverter.broker_whitelist = OwnerVote()
+    broker1 = inverter.join(broker1, {"USD": 10})
+
+    assert broker1.funds == {"USD": 100}
+    assert inverter.get_number_of_brokers() == 0
@@ -1,3 +1,6 @@
+from eth_account import Account
+
+from parameterized import proposal_inverter
 from parameterized.funds import Funds
 from parameterized.proposal_inverter import Wallet
 from parameterized.whitelist_mechanism import NoVote
@@ -10,3 +13,15 @@ def test_deploy():
     assert inverter.funds == {"USD": 500}
     assert inverter.current_epoch == 0
     assert inverter.get_number_of_brokers() == 0
+
+
+def test_generate_eth_account(monkeypatch):
+    private, public = proposal_inverter.generate_eth_account()
+
+    assert len(private) == len(public) + 24 == 66
+    assert public.startswith("0x")
+
+    monkeypatch.setattr(proposal_inverter, "USE_REAL_ETH_ACCOUNTS", True)
+    private, public = proposal_inverter.generate_eth_account()
+
+    assert Account.from_key(private).address == public
@@ -1,8 +1,12 @@
+import logging
 import param as pm
 
 from abc import abstractmethod
 
 
+logger = logging.getLogger(__name__)
+
+
 class WhitelistMechanism(pm.Parameterized):
     """
     This is the base class for all whitelisting mechanisms. Any new whitelisting
@@ -37,7 +41,7 @@ class WhitelistMechanism(pm.Parameterized):
         """
         self.waitlist.add(broker.public)
 
-        if broker.public not in self.votes.keys():
+        if broker.public not in self.votes:
             self.votes[broker.public] = dict()
 
     def in_waitlist(self, broker: "Wallet") -> bool:
@@ -198,7 +202,7 @@ class PayerVote(WhitelistMechanism):
     def _vote_condition(
         self, proposal: "ProposalInverter", voter: "Wallet", broker: "Wallet"
     ) -> bool:
-        voter_is_payer = voter.public in proposal.payer_agreements.keys()
+        voter_is_payer = voter.public in proposal.payer_agreements
 
         return voter_is_payer
 
@@ -231,7 +235,7 @@ class EqualVote(WhitelistMechanism):
     def _vote_condition(
         self, proposal: "ProposalInverter", voter: "Wallet", broker: "Wallet"
     ) -> bool:
-        voter_is_payer = voter.public in proposal.payer_agreements.keys()
+        voter_is_payer = voter.public in proposal.payer_agreements
 
         return voter_is_payer
 
@@ -246,7 +250,7 @@ class EqualVote(WhitelistMechanism):
         return self._voter_fraction(proposal, broker) < self.min_vote
 
     def _voter_fraction(self, proposal: "ProposalInverter", broker: "Wallet") -> float:
-        vote = sum([1 * vote for vote in self.votes[broker.public].values()])
+        vote = sum(self.votes[broker.public].values())
 
         return vote / proposal.get_number_of_payers()
 
@@ -266,7 +270,7 @@ class WeightedVote(WhitelistMechanism):
     def _vote_condition(
         self, proposal: "ProposalInverter", voter: "Wallet", broker: "Wallet"
     ) -> bool:
-        voter_is_payer = voter.public in proposal.payer_agreements.keys()
+        voter_is_payer = voter.public in proposal.payer_agreements
 
         return voter_is_payer
 
@@ -284,17 +288,13 @@ class WeightedVote(WhitelistMechanism):
         self, proposal: "ProposalInverter", broker: "Wallet"
     ) -> float:
         weighted_vote = sum(
-            [
-                proposal.payer_agreements[payer].total_contributions() * vote
-                for payer, vote in self.votes[broker.public].items()
-            ]
+            proposal.payer_agreements[payer].total_contributions() * vote
+            for payer, vote in self.votes[broker.public].items()
         )
         total_contributions = sum(
-            [
-                agreement.total_contributions()
-                for payer, agreement in proposal.payer_agreements.items()
-                if payer != proposal.public
-            ]
+            agreement.total_contributions()
+            for payer, agreement in proposal.payer_agreements.items()
+            if payer != proposal.public
         )
 
         return weighted_vote / total_contributions
@@ -310,8 +310,8 @@ class UnanimousVote(WhitelistMechanism):
     def _vote_condition(
         self, proposal: "ProposalInverter", voter: "Wallet", broker: "Wallet"
     ) -> bool:
-        print("payer agreements", proposal.payer_agreements.keys())
-        voter_is_payer = voter.public in proposal.payer_agreements.keys()
+        logger.debug("payer agreements %s", proposal.payer_agreements.keys())
+        voter_is_payer = voter.public in proposal.payer_agreements
 
         return voter_is_payer
 